@@ -1,10 +1,23 @@
 "Module for simsims simulation world."
+import asyncio
+import heapq
+import os
+import pickle
 import random
+from array import array
 from abc import ABC, abstractmethod
 import time
 from datetime import date
 import threading as th
+from concurrent import futures
+from collections import deque
+from collections.abc import Iterable
+from types import MappingProxyType
 from simsims_analytics import SimsimsAnalytics
+from simsims_reporting import Reporter, ConsoleReporter
+from simsims_instrumentation import Instrumentation
+from simsims_events import EventScheduler
+from simsims_index import PlaceIndex
 
 #############################
 #     World - hand of god   #
@@ -20,9 +33,53 @@ class World: # Model
 
     Attributes:
         sleep_time (float): If the user want to slow down the day iteration.
+        __runtime (str): How the transitions fire, 'threads' (a thread per transition),
+            'pool' (work items submitted to a pool of pool_size threads),
+            'events' (timestamped firings in a single thread) or 'asyncio'
+            (the ticks run as coroutines, tick_async() in an event loop).
+        __executor (ThreadPoolExecutor): The pool, when the runtime is 'pool'.
+        __scheduler (EventScheduler): The coming firings by simulated time, when the
+            runtime is 'events' (no threads, the world advances firing by firing and
+            a day is the time from day to day + 1).
+        __export_results (bool): Export the analytics to Excel and a figure at the end.
+        __figure (str): How the end figure is rendered, 'background' (headless in a
+            detached process, the world does not wait for it), 'headless' or 'show'.
+        __instrumentation (Instrumentation): Counters of firings, tick time and lock
+            waits, with instrument=True, a snapshot per day in the report and database.
+        __checkpoint_every (int): Save a checkpoint to __checkpoint_file every this many
+            days (0 for never). A world created with checkpoint (a file or a checkpoint
+            dict) resumes from it, instead of creating a new settlement.
+        __place_index (PlaceIndex): The places by load, when wiring is 'load': a transition
+            takes its inputs from the most stocked place of a type and sends its outputs to
+            the least loaded one. With 'random' (the default) the places are shuffled.
+        __rebalance_budget (int): With a budget, the transitions are no longer all
+            reconnected every so many days, instead at most this many imbalanced
+            connections are moved a day (0, the default, reconnects them all).
+        __starved (dict[Transition, int]): Times each transition lacked resources,
+            since its connections were last moved.
+        __connected (dict[Place, dict[tuple[Transition, str], None]]): The connections to
+            each place, (transition, name of the connection), kept with a rebalance budget.
+        __transition_numbers (dict[Transition, tuple[str, int]]): Type and index of each
+            transition, the order the imbalanced connections are moved in.
+        __barack_type (type): Barack, or CohortBarack with cohort_barack=True (the workers
+            are counted per longevity, for very large settlements).
+        __barn_policy (str): None for Barns, or the serving policy of BucketBarns, food
+            counted per quality: 'fifo', 'best' (the best food first) or 'worst'.
+        __adaptive_capacity (bool): The capacity of the places adapts to the load, and an
+            overflowing place is only flagged (in __overflowing) when a resource is stored,
+            the places are grown, shrunk, merged and split at the end of the day.
+        __reporter (Reporter): Renders the daily results, a ConsoleReporter by default
+            (NullReporter for headless runs).
+        __random (Random): The world's random stream, seeded by seed. Every transition
+            gets its own stream from it, so a run with the same seed (and a single
+            thread, runtime 'pool' with pool_size 1) is replayed bit-for-bit.
         __end_of_the_world (bool): Has the world come to an end, end the simulation.
-        __analytics (SimSimsAnalytics): Track the daily data from the simulation.
+        __analytics (SimSimsAnalytics): Track the daily data from the simulation, as a run
+            in the database, written in batches in the background with buffered_analytics
+            (by default with the 'asyncio' runtime, so no day blocks the event loop on a commit).
         __day: Track the day, the simulation is on.
+        __resource_totals (dict[str, int]): Running amount of resources per place type,
+            kept up to date by the places on every store and retrieve.
         
     Methods:
         decrease_prio(resource, producer):
@@ -32,51 +89,164 @@ class World: # Model
         __restock_resource(from_place, to_place):
             Moves resources from overflowing place to another emptier place.
         overflowing_resource(places):
-            Manages overflow of resources.
+            Manages overflow of resources, or flags it with adaptive capacity.
+        __adapt_capacity(): Adapts the places to the load, at the end of the day.
+        __spread(resources, key, capacity, exclude): Stores resources in the least loaded places.
         create_place(place): Adds a new place to the world environment.
+        resource_changed(place, amount): Called by a place when its amount of resources change.
+        resource_totals (Mapping[str, int]): Read-only snapshot of the resources per place type.
+        firings (int): Amount of transition firings since the start.
+        adaptive_capacity (bool): Does the capacity of the places adapt to the load.
+        barn_policy (str): The serving policy of the BucketBarns, None for Barns.
+        instrumentation (Instrumentation): The instrumentation, None when disabled.
+        resource_total(place_type): Amount of resources in every place of this type.
         create_transition(transition):
             Initiates a new transition process, and start the transtion thread.
+        checkpoint() -> dict: Snapshot of the world, to resume from.
+        save_checkpoint(filename): Saves the snapshot of the world to a file.
+        spawn_random() -> Random: A new random stream, seeded from the world's stream.
         transition_connect(transition, old_connection):
             Establishes connections for transtions to places.
         tick(): The uppdate method.
+        tick_async(): The uppdate method as a coroutine, for the 'asyncio' runtime.
+        __start_of_day() -> (produce_prio, worker_amount): Checks and priorities of the day.
+        __reconnect() -> bool: Reconnects the transitions every so many days.
+        __rebalance() -> int: Moves the imbalanced connections, within the rebalance budget.
+        __todays_firings(produce_prio, worker_amount): The transitions to fire today.
+        __fire_in_threads(produce_prio, worker_amount): Fire today's transitions as threads.
+        __fire_in_pool(produce_prio, worker_amount): Fire today's transitions in the pool.
+        __fire_in_events(produce_prio, worker_amount): Fire today's firings in time order.
         __result_of_day(): Handels the days result in increase or decrease of resources.
+        stop(): Stops every transition, ends the run and closes the reporter.
         export_to_excel(): Exports simulation data to an Excel file for analysis.
     """
     def __init__(
             self,
             starting_settlement = 40,
             strating_resources = 80,
-            sleep_time = 1
+            sleep_time = 1,
+            runtime = 'threads',
+            pool_size = 4,
+            db_file = 'Simsims_db.db',
+            export_results = True,
+            seed = None,
+            reporter: Reporter = None,
+            buffered_analytics = None,
+            figure = 'background',
+            instrument = False,
+            checkpoint = None,
+            checkpoint_every = 0,
+            checkpoint_file = 'Simsims_checkpoint.pkl',
+            wiring = 'random',
+            rebalance_budget = 0,
+            adaptive_capacity = False,
+            cohort_barack = False,
+            barn_policy = None
             ) -> None:
+        if runtime not in ('threads', 'pool', 'events', 'asyncio'):
+            raise ValueError(f"Unknown runtime: {runtime}")
+        if figure not in ('background', 'headless', 'show'):
+            raise ValueError(f"Unknown figure mode: {figure}")
+        if wiring not in ('random', 'load'):
+            raise ValueError(f"Unknown wiring: {wiring}")
+        if barn_policy is not None and barn_policy not in BucketBarn.POLICIES:
+            raise ValueError(f"Unknown barn policy: {barn_policy}")
         self.__day = 0
         self.sleep_time = sleep_time
+        self.__runtime = runtime
+        self.__export_results = export_results
+        self.__figure = figure
+        self.__reporter = reporter or ConsoleReporter(sleep_time= sleep_time)
+        self.__checkpoint_every = checkpoint_every
+        self.__checkpoint_file = checkpoint_file
+        snapshot: dict = None
+        if checkpoint is not None:
+            snapshot = checkpoint if isinstance(checkpoint, dict) else load_checkpoint(checkpoint)
+            seed = snapshot['seed']
+        if seed is None:
+            seed = random.randrange(2**32) # Stored with the run, so it can be replayed.
+        self.__seed = seed
+        self.__random = random.Random(seed)
+        self.__executor: futures.ThreadPoolExecutor = None
+        if runtime == 'pool':
+            self.__executor = futures.ThreadPoolExecutor(max_workers= pool_size)
+        self.__scheduler: EventScheduler = None
+        if runtime == 'events':
+            self.__scheduler = EventScheduler()
         self.__end_of_the_world = False
+        self.__firings = 0
+        self.__stopped = False
+        self.__instrumentation = Instrumentation() if instrument else None
         self.__analytics: SimsimsAnalytics
 
         self.__priority: dict[Transition, int] = {}
         self.__transistions: dict[Transition, list[Transition]] = {}
         self.__places: dict[Place, list[Place]] = {}
+        self.__registered_places: set[Place] = set()
+        self.__resource_totals: dict[str, int] = {}
+        self.__totals_lock = th.Lock()
+        self.__place_index = PlaceIndex() if wiring == 'load' else None
+        self.__rebalance_budget = rebalance_budget
+        self.__starved: dict[Transition, int] = {}
+        self.__connected: dict[Place, dict[tuple[Transition, str], None]] = {}
+        self.__connections: dict[Transition, dict[str, Place]] = {}
+        self.__transition_numbers: dict[Transition, tuple[str, int]] = {}
+        self.__adaptive_capacity = adaptive_capacity
+        self.__barack_type = CohortBarack if cohort_barack else Barack
+        self.__barn_policy = barn_policy
+        self.__overflowing: dict[Place, None] = {}
 
         self.__thread_observer = self.ThreadObserver()
         self.__lock = th.RLock()
+        if self.__instrumentation is not None:
+            self.__lock = self.__instrumentation.lock('world', 'World', self.__lock)
 
-        barack = Barack(self)
+        if snapshot is not None:
+            self.__restore(snapshot)
+        else:
+            self.__create_settlement(starting_settlement, strating_resources)
+
+        table_columns = ['Worker', 'Product', 'Food']
+
+        if buffered_analytics is None:
+            buffered_analytics = runtime == 'asyncio'
+        self.__analytics = SimsimsAnalytics(db_file, table_columns,
+                                            buffered= buffered_analytics)
+        self.__analytics.create_table()
+        self.__analytics.start_run(config= {
+            'engine': 'threads',
+            'starting_settlement': starting_settlement,
+            'strating_resources': strating_resources,
+            'runtime': runtime,
+            'pool_size': pool_size,
+            'wiring': wiring,
+            'rebalance_budget': rebalance_budget,
+            'adaptive_capacity': adaptive_capacity,
+            'cohort_barack': cohort_barack,
+            'barn_policy': barn_policy,
+            'resumed_day': snapshot['day'] if snapshot else None,
+            }, seed= seed)
+
+    def __create_settlement(self, starting_settlement: int, strating_resources: int):
+        barack = self.__barack_type(self)
         self.create_place(barack)
 
         # Populate the barack
-        for _ in range(starting_settlement):
-            barack.store(Worker())
+        barack.store_many(Worker(self.__random) for _ in range(starting_settlement))
 
         warehouse = Warehouse(self)
-        barn = Barn(self)
+        barn = BucketBarn(self) if self.__barn_policy else Barn(self)
         self.create_place(warehouse)
         self.create_place(barn)
 
+        food, products = [], []
         for _ in range(0, strating_resources):
-            if not random.randint(0,1):
-                barn.store(Food())
+            if not self.__random.randint(0,1):
+                food.append(Food(rng= self.__random))
             else:
-                warehouse.store(Product())
+                products.append(Product())
+        barn.store_many(food)
+        warehouse.store_many(products)
 
         # Create a small initial settlement.
         for _ in range(0,4):
@@ -86,12 +256,103 @@ class World: # Model
             self.create_transition(Home(self))
             self.create_transition(Home(self))
 
-
-        table_columns = ['Worker', 'Product', 'Food']
-
-        self.__analytics = SimsimsAnalytics('Simsims_db.db', table_columns)
-        self.__analytics.drop_table() # Make sure we use fresh table.
-        self.__analytics.create_table()
+    def checkpoint(self) -> dict:
+        """
+        Snapshot of the world between two days, plain data (ints, bytes, dicts and lists)
+        that can be pickled: the places with their resources, the transitions with their
+        parameters, connections and random streams, the priorities, the day and the
+        world's random stream. A worker is saved once (its longevity, one byte) and the
+        baracks refer to it by index, so a worker stored twice is still the same worker.
+        A place no longer in the world, but still connected to a transition, is saved
+        as detached, after the places of its type.
+        """
+        workers: dict[Worker, int] = {}
+        places = {key: [dict(place._checkpoint(workers), capacity= place.capacity,
+                             type= type(place).__name__)
+                        for place in self.__places[key]]
+                  for key in self.__places}
+        place_index = {place: (key, index) for key in self.__places
+                       for index, place in enumerate(self.__places[key])}
+        detached: dict[str, list[Place]] = {}
+        for key in self.__transistions:
+            for transition in self.__transistions[key]:
+                for place in transition.connections.values():
+                    if place not in place_index:
+                        place_key = place.kind
+                        detached_places = detached.setdefault(place_key, [])
+                        place_index[place] = (place_key, len(self.__places[place_key]) +
+                                                         len(detached_places))
+                        detached_places.append(place)
+        detached_states = {key: [dict(place._checkpoint(workers), capacity= place.capacity,
+                                      type= type(place).__name__)
+                                 for place in detached[key]]
+                           for key in detached}
+        transition_index = {transition: (key, index) for key in self.__transistions
+                            for index, transition in enumerate(self.__transistions[key])}
+        next_firing = {}
+        if self.__scheduler is not None:
+            next_firing = {transition: time for time, transition in self.__scheduler.pending()}
+        return {
+            'version': CHECKPOINT_VERSION,
+            'seed': self.__seed,
+            'day': self.__day,
+            'firings': self.__firings,
+            'random': self.__random.getstate(),
+            'priority': dict(self.__priority),
+            'workers': bytes(worker.longevity for worker in workers),
+            'places': places,
+            'detached': detached_states,
+            'starved': [(transition_index[transition], starved)
+                        for transition, starved in self.__starved.items()],
+            'transitions': {key: [transition._checkpoint(place_index, next_firing.get(transition))
+                                  for transition in self.__transistions[key]]
+                            for key in self.__transistions},
+        }
+
+    def save_checkpoint(self, filename: str = None):
+        "Save the checkpoint, replacing the previous one only when it is completely written."
+        filename = filename or self.__checkpoint_file
+        with open(filename + '.tmp', 'wb') as file:
+            pickle.dump(self.checkpoint(), file, protocol= pickle.HIGHEST_PROTOCOL)
+        os.replace(filename + '.tmp', filename)
+
+    def __restore(self, snapshot: dict):
+        check_checkpoint(snapshot)
+        place_types = {'Barack': Barack, 'CohortBarack': CohortBarack,
+                       'Warehouse': Warehouse, 'Barn': Barn, 'BucketBarn': BucketBarn}
+        transition_types = {'Factory': Factory, 'Fields': Fields, 'Dining': Dining, 'Home': Home}
+        workers = [Worker(longevity= longevity) for longevity in snapshot['workers']]
+
+        for key, states in snapshot['places'].items():
+            for state in states:
+                place = place_types[state.get('type', key)](self)
+                place._set_capacity(state.get('capacity', Place.CAPACITY))
+                self.create_place(place)
+                place._restore(state, workers)
+
+        places = {key: list(self.__places[key]) for key in self.__places}
+        for key, states in snapshot.get('detached', {}).items():
+            for state in states:
+                place = place_types[state.get('type', key)](self)
+                place._set_capacity(state.get('capacity', Place.CAPACITY))
+                place._restore(state, workers)
+                places[key].append(place)
+
+        for key, states in snapshot['transitions'].items():
+            for state in states:
+                transition = transition_types[key](self)
+                transition._restore(state, places)
+                self.__add_transition(transition, state['next_firing'])
+
+        for (key, index), starved in snapshot.get('starved', []):
+            self.__starved[self.__transistions[key][index]] = starved
+
+        self.__day = snapshot['day']
+        self.__firings = snapshot['firings']
+        self.__priority = dict(snapshot['priority'])
+        self.__random.setstate(snapshot['random'])
+        if self.__scheduler is not None:
+            self.__scheduler.now = float(self.__day)
 
     # def decrease_prio(self, resource: 'Resource', producer: 'Transition'):
     def decrease_prio(self, producer: 'Transition'):
@@ -109,24 +370,24 @@ class World: # Model
 
         assert len(places) > 0
         key = str(type(transition).__name__)
+        if self.__rebalance_budget:
+            self.__starved[transition] = self.__starved.get(transition, 0) + 1
         # Also check amount of resource overall, should this place be removed.
         for place in places:
             if len(place) == 0:
-                amount = 0
-                for place_in_list in self.__places[str(type(place).__name__)]:
-                    # len of Place in list will give resource amount.
-                    amount = amount + len(place_in_list)
+                amount = self.resource_total(place.kind)
 
                 # If exists more than one place of this place_type,
                 #  and total amount is less than half the capacity in each of this type.
-                identical_place = len(self.__places[str(type(place).__name__)])
+                identical_place = len(self.__places[place.kind])
                 if identical_place > 1 and amount < (place.capacity // 2) * identical_place:
                     for tmp_transition in self.__transistions[key]:
                         # Reconect the transistions from this transistion.
                         self.transition_connect(transition= tmp_transition, old_connection= place)
-                    for index, place_in_list in enumerate(self.__places[str(type(place).__name__)]):
-                        if self.__places[str(type(place).__name__)][index] == place:
-                            self.__places[str(type(place).__name__)].pop(index)
+                    for index, place_in_list in enumerate(self.__places[place.kind]):
+                        if self.__places[place.kind][index] == place:
+                            self.__places[place.kind].pop(index)
+                            self.__remove_place(place)
 
                 self.__raise_priority(transition, place)
             else:
@@ -156,29 +417,35 @@ class World: # Model
 
 
     def __restock_resource(self, from_place: 'Place', to_place: 'Place'):
-        for _ in range(0, from_place.capacity // 2):
-            resource = from_place.retrieve()
-            to_place.store(resource)
+        to_place.store_many(from_place.retrieve_many(from_place.capacity // 2))
 
     def overflowing_resource(self, places: list['Place']):
+        if self.__adaptive_capacity:
+            # Called while storing, with the place locked, only flag it for the end of the day.
+            with self.__totals_lock:
+                self.__overflowing.update(dict.fromkeys(places))
+            return
+
         selected_place:Place = None
 
         for place in places:
-            amount = 0
-            place_name = str(type(place).__name__)
-            for place_in_list in self.__places[place_name]:
-                amount = amount + len(place_in_list)
+            place_name = place.kind
+            amount = self.resource_total(place_name)
 
             if amount > place.capacity * len(self.__places[place_name]):
                 # Create a new identical place, aka blueprint and store some there.
                 blueprint = type(self.__places[place_name][0])(self)
                 selected_place = blueprint
-                self.__places[place_name].append(blueprint)
+                self.create_place(blueprint)
 
             if len(place) >= place.capacity:
                 # Check if we created a new place, otherwise randomize for one.
-                if selected_place == None:
-                    random.shuffle(self.__places[place_name])
+                if selected_place == None and self.__place_index is not None:
+                    selected_place = self.__place_index.least_loaded(place_name, exclude= place)
+                    if selected_place is None:
+                        selected_place = place
+                elif selected_place == None:
+                    self.__random.shuffle(self.__places[place_name])
                     selected_place = self.__places[place_name][0]
 
                 # Make sure the selected place can recieve the resources,
@@ -188,7 +455,7 @@ class World: # Model
                 else:
                     blueprint = type(self.__places[place_name][0])(self)
                     selected_place = blueprint
-                    self.__places[place_name].append(blueprint)
+                    self.create_place(blueprint)
                     self.__restock_resource(from_place= place, to_place= selected_place)
 
     @property
@@ -196,25 +463,71 @@ class World: # Model
         return str(self.__day)
 
     @property
-    def check_endOfTheWorld(self) -> bool:
-        for place in self.__places:
-            amount = 0
-            for building in self.__places[place]:
-                amount += len(building)
+    def firings(self) -> int:
+        return self.__firings
 
-            if place == 'Barack' and amount == 0:
-                self.__end_of_the_world = True
+    @property
+    def instrumentation(self) -> Instrumentation:
+        return self.__instrumentation
+
+    @property
+    def adaptive_capacity(self) -> bool:
+        return self.__adaptive_capacity
+
+    @property
+    def barn_policy(self) -> str:
+        return self.__barn_policy
+
+    @property
+    def check_endOfTheWorld(self) -> bool:
+        if 'Barack' in self.__places and self.resource_total('Barack') == 0:
+            self.__end_of_the_world = True
 
         return self.__end_of_the_world
 
     def create_place(self, place : 'Place'):
         assert isinstance(place, Place)
 
-        key = str(type(place).__name__)
+        key = place.kind
         if key not in self.__places.keys():
             self.__places[key] = []
 
         self.__places[key].append(place)
+        with self.__totals_lock:
+            self.__registered_places.add(place)
+            self.__resource_totals[key] = self.__resource_totals.get(key, 0) + len(place)
+        if self.__place_index is not None:
+            self.__place_index.add(key, place)
+
+    def __remove_place(self, place: 'Place'):
+        "The place is no longer part of the world, stop counting its resources."
+        with self.__totals_lock:
+            if place in self.__registered_places:
+                self.__registered_places.remove(place)
+                self.__resource_totals[place.kind] -= len(place)
+        if self.__place_index is not None:
+            self.__place_index.remove(place)
+
+    def resource_changed(self, place: 'Place', amount: int):
+        "Called by the places, when the amount of resources in the place change."
+        with self.__totals_lock:
+            if place in self.__registered_places:
+                self.__resource_totals[place.kind] += amount
+        if self.__place_index is not None:
+            self.__place_index.changed(place)
+
+    @property
+    def resource_totals(self) -> MappingProxyType:
+        "Read-only snapshot of the amount of resources per place type."
+        with self.__totals_lock:
+            return MappingProxyType(dict(self.__resource_totals))
+
+    def resource_total(self, place_type: str) -> int:
+        return self.__resource_totals.get(place_type, 0)
+
+    def spawn_random(self) -> random.Random:
+        "A new random stream for a transition, seeded from the world's stream."
+        return random.Random(self.__random.getrandbits(64))
 
     def create_transition(self, transition: 'Transition'):
         assert isinstance(transition, Transition)
@@ -224,8 +537,23 @@ class World: # Model
             self.__transistions[key] = []
 
         self.transition_connect(transition)
+        self.__add_transition(transition)
+
+    def __add_transition(self, transition: 'Transition', first_firing: float = None):
+        key = str(type(transition).__name__)
+        if key not in self.__transistions.keys():
+            self.__transistions[key] = []
+
         self.__transistions[key].append(transition)
-        transition.start() # Start the transition thread.
+        if self.__rebalance_budget:
+            self.__transition_numbers[transition] = (key, len(self.__transistions[key]) - 1)
+            self.__track_connections(transition)
+        if self.__runtime == 'threads' and not self.__stopped:
+            transition.start() # Start the transition thread.
+        elif self.__scheduler is not None:
+            if first_firing is None:
+                first_firing = self.__scheduler.now + transition.duration()
+            self.__scheduler.schedule(first_firing, transition)
         if key not in self.__priority:
             self.__priority[key] = 0
 
@@ -237,19 +565,45 @@ class World: # Model
         for blueprint in transition.c_out_blueprint:
             self.connect_logik(transition, blueprint, in_connect= False,
                                out_connect= True, old_connection = old_connection)
+        if self.__rebalance_budget:
+            self.__track_connections(transition)
+
+    def __track_connections(self, transition: 'Transition'):
+        "Update the transitions connected to each place, after the transition was connected."
+        for name, place in self.__connections.get(transition, {}).items():
+            connected = self.__connected[place]
+            connected.pop((transition, name), None)
+            if not connected:
+                del self.__connected[place]
+        connections = transition.connections
+        for name, place in connections.items():
+            self.__connected.setdefault(place, {})[(transition, name)] = None
+        self.__connections[transition] = connections
 
     def connect_logik(self, transition: 'Transition', connection,
                       in_connect = False, out_connect = False, old_connection = None):
+        if self.__place_index is not None:
+            # The place types are keyed by name, the blueprint is the type itself.
+            if in_connect:
+                place = self.__place_index.most_stocked(connection.__name__, old_connection)
+            else:
+                place = self.__place_index.least_loaded(connection.__name__, old_connection)
+            if place is not None and in_connect:
+                transition.connect_in(place)
+            elif place is not None:
+                transition.connect_out(place)
+            return
+
         if in_connect:
             for place in self.__places:
-                random.shuffle(self.__places[place])
+                self.__random.shuffle(self.__places[place])
                 if (isinstance(self.__places[place][0], connection) and
                         self.__places[place][0] != old_connection):
                     transition.connect_in(self.__places[place][0])
 
         if out_connect:
             for place in self.__places:
-                random.shuffle(self.__places[place])
+                self.__random.shuffle(self.__places[place])
                 if (isinstance(self.__places[place][0], connection) and
                         self.__places[place][0] != old_connection):
                     transition.connect_out(self.__places[place][0])
@@ -296,7 +650,42 @@ class World: # Model
 
 
     def tick(self):
-        worker_amount = 0
+        if self.__runtime == 'asyncio':
+            return asyncio.run(self.tick_async())
+
+        produce_prio, worker_amount = self.__start_of_day()
+
+        if self.__runtime == 'pool':
+            self.__fire_in_pool(produce_prio, worker_amount)
+        elif self.__runtime == 'events':
+            self.__fire_in_events(produce_prio, worker_amount)
+        else:
+            self.__fire_in_threads(produce_prio, worker_amount)
+
+        if self.__adaptive_capacity:
+            self.__adapt_capacity()
+        if self.__reconnect() and self.sleep_time:
+            time.sleep(self.sleep_time)
+
+        return self.__result_of_day()
+
+    async def tick_async(self) -> bool:
+        "The uppdate method of the 'asyncio' runtime, today's ticks run as coroutines."
+        produce_prio, worker_amount = self.__start_of_day()
+
+        todays_firings = self.__todays_firings(produce_prio, worker_amount)
+        self.__firings += len(todays_firings)
+        # The day barrier, every firing of the day is done.
+        await asyncio.gather(*(transition.tick_async() for transition in todays_firings))
+
+        if self.__adaptive_capacity:
+            self.__adapt_capacity()
+        if self.__reconnect() and self.sleep_time:
+            await asyncio.sleep(self.sleep_time)
+
+        return self.__result_of_day()
+
+    def __start_of_day(self) -> tuple[list[str], int]:
         # Check so we have places and transitions.
         for transition in self.__transistions:
             assert len(self.__transistions[transition]) > 0
@@ -307,9 +696,135 @@ class World: # Model
         produce_prio = sorted(self.__priority, key=self.__priority.get, reverse=True)
 
         # Limit iterations based on existing workers.
-        for barack in self.__places['Barack']:
-            worker_amount = worker_amount + len(barack)
+        worker_amount = self.resource_total('Barack')
+        return produce_prio, worker_amount
+
+    def __reconnect(self) -> bool:
+        "Reconnect every transition every so many days, returns True if it did."
+        if self.__rebalance_budget:
+            with self.__lock:
+                return self.__rebalance() > 0
+
+        transition_length = 0
+        for place in self.__transistions:
+            transition_length = transition_length + len(self.__transistions[place])
+        if (self.__day + 1) % transition_length == 0:
+            for place in self.__transistions:
+                for transition in self.__transistions[place]:
+                    self.transition_connect(transition)
+            return True
+        return False
+
+    def __adapt_capacity(self):
+        """
+        Adapt the places of every type to the load, one bulk operation per type: the
+        capacity is doubled while the places are more than 3/4 full and halved (not below
+        Place.CAPACITY) while they are less than 1/4 full, the emptiest place is merged
+        into the others while they hold it at half their capacity, and a place above the
+        capacity is split, the resources above half the capacity move to the least loaded.
+        """
+        with self.__lock:
+            with self.__totals_lock:
+                overflowing, self.__overflowing = self.__overflowing, {}
+            for key, places in self.__places.items():
+                total = self.resource_total(key)
+                capacity = old_capacity = places[0].capacity
+                while total > capacity * len(places) * 3 // 4:
+                    capacity *= 2
+                while capacity > Place.CAPACITY and total < capacity * len(places) // 4:
+                    capacity //= 2
+                merge = len(places) > 1 and total <= capacity * (len(places) - 1) // 2
+                if (capacity == old_capacity and not merge and
+                        not any(place in overflowing for place in places)):
+                    continue
+
+                for place in places:
+                    place._set_capacity(capacity)
+                    if self.__place_index is not None:
+                        self.__place_index.changed(place)
+
+                while len(places) > 1 and total <= capacity * (len(places) - 1) // 2:
+                    emptiest = min(places, key= len)
+                    places.remove(emptiest)
+                    self.__remove_place(emptiest)
+                    self.__spread(emptiest.retrieve_many(len(emptiest)), key, capacity)
+                    for transitions in self.__transistions.values():
+                        for transition in transitions:
+                            if emptiest in transition.connections.values():
+                                self.transition_connect(transition, old_connection= emptiest)
+
+                for place in list(places):
+                    if len(place) > capacity:
+                        resources = place.retrieve_many(len(place) - capacity // 2)
+                        self.__spread(resources, key, capacity, exclude= place)
+
+    def __spread(self, resources: list['Resource'], key: str, capacity: int, exclude = None):
+        "Store the resources in the least loaded places of the type up to 3/4 full, the rest in a new place."
+        for place in sorted(self.__places[key], key= len):
+            if not resources:
+                return
+            room = capacity * 3 // 4 - len(place)
+            if place is not exclude and room > 0:
+                place.store_many(resources[:room])
+                resources = resources[room:]
+        if resources:
+            blueprint = exclude if exclude is not None else self.__places[key][0]
+            place = type(blueprint)(self)
+            place._set_capacity(capacity)
+            self.create_place(place)
+            place.store_many(resources)
+
+    def __rebalance(self) -> int:
+        """
+        Move the imbalanced connections, at most rebalance_budget of them: first the
+        inputs of the most starved transitions from their empty places, then every
+        connection to a place that is no longer in the world, the inputs from places
+        with less than half the mean amount of their type, and the outputs to places
+        with more than twice the mean. Returns the amount of moved connections.
+        """
+        numbers = self.__transition_numbers
+        # The order to move them in, by reason and then by transition.
+        moves: dict[tuple[Transition, str], tuple] = {}
+        for transition, starved in self.__starved.items():
+            for name, place in transition.connections.items():
+                if name.startswith('_in_') and len(place) == 0:
+                    moves[(transition, name)] = (0, -starved, numbers[transition], name)
+
+        for place, connected in self.__connected.items():
+            key = place.kind
+            removed = place not in self.__registered_places
+            if not removed and len(self.__places[key]) < 2:
+                continue
+            mean = self.resource_total(key) / len(self.__places[key])
+            starving, crowded = len(place) < mean / 2, len(place) > mean * 2
+            for transition, name in connected:
+                if removed:
+                    moves.setdefault((transition, name), (1, 0, numbers[transition], name))
+                elif starving if name.startswith('_in_') else crowded:
+                    moves.setdefault((transition, name), (2, 0, numbers[transition], name))
+
+        moved = 0
+        for transition, name in heapq.nsmallest(self.__rebalance_budget, moves, key= moves.get):
+            place = transition.connections[name]
+            in_connect = name.startswith('_in_')
+            blueprints = transition.c_in_blueprint if in_connect else transition.c_out_blueprint
+            blueprint = next(blueprint for blueprint in blueprints if isinstance(place, blueprint))
+            self.connect_logik(transition, blueprint, in_connect= in_connect,
+                               out_connect= not in_connect, old_connection= place)
+            self.__track_connections(transition)
+            self.__starved.pop(transition, None)
+            moved += 1
+        return moved
+
+    def __todays_firings(self, produce_prio: list[str], worker_amount: int) -> list['Transition']:
+        "Today's transitions to fire, by priority, the first iterations of every type."
+        firings = []
+        for producer in produce_prio:
+            iterations = worker_amount // 10 + (len(produce_prio) * 2)
+            firings.extend(self.__transistions[producer][:iterations])
+        return firings
 
+    def __fire_in_threads(self, produce_prio: list[str], worker_amount: int):
         self.__thread_observer.ticking(still_ticking= True)
         for producer in produce_prio:
             iterations = worker_amount // 10 + (len(produce_prio) * 2)
@@ -320,72 +835,137 @@ class World: # Model
                     if not self.__thread_observer.limit:
                         transition.continue_run()
                         self.__thread_observer.add_thread(transition)
+                        self.__firings += 1
                     else:
-                        self.__thread_observer.new_thread.wait()
+                        self.__observer_wait(self.__thread_observer.new_thread, 'new_thread')
                         self.__thread_observer.new_thread.clear()
                     iterations = iterations - 1
 
         if not self.__thread_observer.all_finished.is_set():
-            self.__thread_observer.all_finished.wait()
+            self.__observer_wait(self.__thread_observer.all_finished, 'all_finished')
             self.__thread_observer.all_finished.clear()
 
-        transition_length = 0
-        for place in self.__transistions:
-            transition_length = transition_length + len(self.__transistions[place])
-        if (self.__day + 1) % transition_length == 0:
-            for place in self.__transistions:
-                for transition in self.__transistions[place]:
-                    self.transition_connect(transition)
-            time.sleep(self.sleep_time)
+    def __observer_wait(self, event: th.Event, name: str):
+        if self.__instrumentation is None:
+            event.wait()
+        else:
+            with self.__instrumentation.waiting('observer', name):
+                event.wait()
 
-        return self.__result_of_day()
+    def __fire_in_pool(self, produce_prio: list[str], worker_amount: int):
+        firings: list[futures.Future] = [
+            self.__executor.submit(transition.tick)
+            for transition in self.__todays_firings(produce_prio, worker_amount)]
+        self.__firings += len(firings)
+
+        # All of today's firings are done, raises if a firing failed.
+        for firing in futures.as_completed(firings):
+            firing.result()
+
+    def __fire_in_events(self, produce_prio: list[str], worker_amount: int):
+        # The same amount of firings per transition type today as the other runtimes,
+        # a transition due when its type has none left idles until its next firing.
+        iterations = worker_amount // 10 + (len(produce_prio) * 2)
+        left = dict.fromkeys(produce_prio, iterations)
+
+        def fire(transition: Transition, time: float) -> float:
+            key = repr(transition)
+            if left.get(key, 0) > 0:
+                left[key] -= 1
+                transition.tick()
+                self.__firings += 1
+            return time + transition.duration()
+
+        self.__scheduler.run_until(self.__day + 1, fire)
 
 
         #########################################
         # Some logs in the terminal for the days result.
         #########################################
     def __result_of_day(self) -> bool:
-        print(f"Result of the day: {self.__day}", end= "")
-        data = []
-
+        resources = {}
         for place in self.__places:
-            resource_of_place = sum(len(building) for building in self.__places[place])
-            if place == 'Barack' and resource_of_place == 0:
+            resources[place] = self.resource_total(place)
+            if place == 'Barack' and resources[place] == 0:
                 self.__end_of_the_world = True
 
-            print(f"\n{self.__places[place][0]} {resource_of_place}", end="")
-            time.sleep(self.sleep_time * 0.2)
-            data.append(resource_of_place)
-
-        print()
-        for place in self.__places:
-            print(f"{place}: {len(self.__places[place])}", end=" ")
-        print()
-        for transition in self.__transistions:
-            print(f"{transition}: {len(self.__transistions[transition])}", end=" ")
+        report = {
+            'day': self.__day,
+            'resources': resources,
+            'labels': {place: str(self.__places[place][0]) for place in self.__places},
+            'places': {place: len(self.__places[place]) for place in self.__places},
+            'transitions': {transition: len(self.__transistions[transition])
+                            for transition in self.__transistions},
+            }
+        if self.__instrumentation is not None:
+            report['instrumentation'] = self.__instrumentation.snapshot()
+        self.__reporter.report_day(report, last_day= self.__end_of_the_world)
 
         # Add the day, to the database.
-        # self.__analytics.add_step(self.__Day, data = tuple(data))
-        self.__analytics.add_step(data = tuple(data))
+        self.__analytics.add_step(data = tuple(resources.values()), day= self.__day)
+        if self.__instrumentation is not None:
+            self.__analytics.add_snapshot(report['instrumentation'], day= self.__day)
 
         if not self.__end_of_the_world:
             self.__day += 1
-            print("\n")
+            if self.__checkpoint_every and self.__day % self.__checkpoint_every == 0:
+                self.save_checkpoint()
         else: # End of the Civilization.
-            for key in self.__transistions:
-                for transition in self.__transistions[key]:
-                    transition.stop()
-            self.__transistions = {}
+            self.__reporter.report_end(self.__day)
+            self.stop()
             self.__places = {}
-            self.export_to_excel()
-            print(f"\nThe civilisation lasted: {this_world.Days} days.")
-            self.__analytics.to_figure("Simsim_graph")
+            self.__registered_places = set()
+            self.__resource_totals = {}
+            if self.__export_results:
+                self.export_to_excel()
+            if self.__export_results:
+                if self.__figure == 'background':
+                    self.__analytics.to_figure_background("Simsim_graph")
+                else:
+                    self.__analytics.to_figure("Simsim_graph", show= self.__figure == 'show')
         return self.__end_of_the_world
 
+    def stop(self):
+        "Stop every transition (thread), also used to end a run before the end of the world."
+        self.__stopped = True # No new transition threads from here.
+        transitions = [transition for key in self.__transistions
+                       for transition in self.__transistions[key]]
+        for transition in transitions:
+            transition.stop()
+        # Wait for a transition still in its tick, it may look in the transitions.
+        for transition in transitions:
+            if transition.is_alive():
+                transition.join()
+        self.__transistions = {}
+        if self.__executor is not None:
+            self.__executor.shutdown()
+        self.__analytics.stop_writer()  # Every buffered day is written.
+        self.__analytics.end_run(self.__day)
+        self.__reporter.close()
+
 
     def export_to_excel(self):
-        filename = 'Simsims_' + str(date.today())
-        self.__analytics.to_excel(filename= filename)
+        # A file per run, streamed, instead of loading and saving a growing workbook.
+        filename = f'Simsims_{date.today()}_run{self.__analytics.run_id}'
+        self.__analytics.to_excel_stream(filename= filename)
+
+
+# The format of World.checkpoint, a checkpoint of another version is not resumed.
+CHECKPOINT_VERSION = 1
+
+def check_checkpoint(snapshot: dict) -> dict:
+    "Check that the snapshot is a checkpoint of this version, returns it."
+    if not isinstance(snapshot, dict) or 'version' not in snapshot:
+        raise ValueError("Not a simsims checkpoint")
+    if snapshot['version'] != CHECKPOINT_VERSION:
+        raise ValueError(f"Unsupported checkpoint version: {snapshot['version']}, "
+                         f"expected {CHECKPOINT_VERSION}")
+    return snapshot
+
+def load_checkpoint(filename: str) -> dict:
+    "Load a checkpoint saved by World.save_checkpoint, resume with World(checkpoint=...)."
+    with open(filename, 'rb') as file:
+        return check_checkpoint(pickle.load(file))
 
 
 #############################
@@ -394,10 +974,13 @@ class World: # Model
 class Resource:
     """
 Resource class serving as a base type for all resource entities within the world model.
+The resources use __slots__, there can be millions of them.
 
 Methods:
     __init__ (): Initializes a new instance of the Resource class.
 """
+    __slots__ = ()
+
     def __init__(self) -> None:
         pass
 
@@ -412,20 +995,71 @@ their living status as (alive or deceased).
 
 Attributes:
     is_alive (bool): Property indicating whether the worker is alive or not.
+    __home (Barack | dict[Barack, int] | None): The barack storing this worker, a dict
+        if it is stored in more than one barack.
+    __home_state (int): Home state for a single barack, stored copies * 2 + 1 if the
+        copies are counted as dead (kept by the Barack).
 
 Methods:
-    __init__ (): Initializes a new instance of the Worker class with a random longevity 
-        value between 10 and 100.
+    __init__ (rng, longevity): Initializes a new instance of the Worker class with a random
+        longevity value between 10 and 100, drawn from rng (the random module if None),
+        or with the given longevity.
+    longevity (int): The worker's longevity, 0 to 100.
     longevity_change(change: int): Updates the worker's longevity, ensuring it stays 
-        within the range of 0 to 100.
+        within the range of 0 to 100. Reports a death (or revival) to its baracks.
+    _home_state(barack) -> int: Home state of this worker in the barack, 0 if not stored.
+    _set_home_state(barack, state): Updates the home state of this worker in the barack.
+    _baracks() -> list[Barack]: The baracks storing this worker.
 """
-    def __init__(self):
+    __slots__ = ('__longevity', '__home', '__home_state')
+
+    def __init__(self, rng: random.Random = None, longevity: int = None):
         super().__init__()
-        self.__longevity = random.randint(10,100) # 100
+        if longevity is None:
+            longevity = (rng or random).randint(10,100) # 100
+        self.__longevity = longevity
+        self.__home = None
+        self.__home_state = 0
 
 
     def longevity_change(self, change: int):
+        was_alive = self.__longevity > 0
         self.__longevity = max(min(self.__longevity + change, 100), 0)
+        if was_alive != (self.__longevity > 0):
+            for barack in self._baracks():
+                barack.living_changed(self)
+
+    def _home_state(self, barack: 'Barack') -> int:
+        if self.__home is barack:
+            return self.__home_state
+        if isinstance(self.__home, dict):
+            return self.__home.get(barack, 0)
+        return 0
+
+    def _set_home_state(self, barack: 'Barack', state: int):
+        home = self.__home
+        if home is None or home is barack:
+            self.__home = barack if state else None
+            self.__home_state = state
+        elif isinstance(home, dict):
+            if state:
+                home[barack] = state
+            else:
+                home.pop(barack, None)
+        elif state:
+            # Stored in a second barack, rare enough for a dict.
+            self.__home = {home: self.__home_state, barack: state}
+
+    def _baracks(self) -> list['Barack']:
+        if self.__home is None:
+            return []
+        if isinstance(self.__home, dict):
+            return list(self.__home)
+        return [self.__home]
+
+    @property
+    def longevity(self) -> int:
+        return self.__longevity
 
     @property
     def is_alive(self):
@@ -445,12 +1079,15 @@ Attributes:
     quality (int): The quality of the food item, maximum of 100.
 
 Methods:
-    __init__(initial_quality): Initializes a new instance of the Food class with a quality 
-        value (defaulting between 40 and 100).
+    __init__(initial_quality, rng): Initializes a new instance of the Food class with a quality 
+        value (defaulting between 40 and 100, drawn from rng or the random module).
 """
+    __slots__ = ('__quality',)
 
-    def __init__(self, initial_quality = random.randint(40, 100)):
+    def __init__(self, initial_quality: int = None, rng: random.Random = None):
         super().__init__()
+        if initial_quality is None:
+            initial_quality = (rng or random).randint(40, 100)
         self.__quality: int = min(initial_quality, 100)
 
     @property
@@ -465,11 +1102,14 @@ products that can be stored and managed in various locations.
 
 This class extends the Resource base class, allowing for possible product-specific
 functionality to be implemented in the future.
+Products carry no state, they are fungible tokens and a Warehouse only counts them.
 
 Methods:
     __init__(): Initializes a new instance of the Product class, inheriting from 
         the Resource class.
 """
+    __slots__ = ()
+
     def __init__(self):
         super().__init__()
 
@@ -490,18 +1130,26 @@ for subclasses to implement specific storage mechanisms and resource types, ensu
 that all storage locations follows same foundation logic.
 
 Attributes:
-    _storage (list[Resource]): List to hold resources managed by the Place.
+    _storage (deque[Resource]): Double-ended queue to hold resources managed by the Place,
+        O(1) store and retrieve at both ends (FIFO and LIFO).
+    CAPACITY (int): The capacity of a new Place.
     _capcity (int): Maximum capacity of the Place, defining how many resources it can store.
     _world_controll (World): Reference to the world/model simulation controller.
     __lock (RLock): Reentrant lock for managing multiple access of the same transition
         to acces resources.
+    _lock (RLock): The same lock, for subclasses that update their storage outside of
+        store and retrieve.
 
 Methods:
     handle_resource (str): Abstract property to specify the type of resource handled by 
         subclasses.
+    kind (str): The place type the world keys the place by, the class name by default.
     store(Resource): Public method to add a resource to the storage while managing access.
+    store_many(Iterable[Resource]): Adds resources in order, taking the lock once.
     _store(Resource): Abstract method to implement the actual storing logic in subclasses.
+    _store_many(list[Resource]): Stores the resources, one _store each unless overridden.
     capacity (int): Abstract property to return the maximum capacity of the Place.
+    _set_capacity(capacity): Changes the capacity, for the world's adaptive capacity.
     __len__ () -> int: Abstract method to return the current number of resources in storage.
     __str__ () -> str: Abstract method for string representation of the Place.
     __repr__ () -> str: Provides a string representation of the Place object type.
@@ -509,29 +1157,64 @@ Methods:
         while managing transition/thread access.
     _retrieve() -> Resource: Abstract method to implement the actual retrieval logic 
         in subclasses.
+    retrieve_many(amount) -> list[Resource]: Retrieves up to amount resources in
+        retrieval order, taking the lock once.
+    _retrieve_many(amount) -> list[Resource]: Retrieves amount resources, one _retrieve
+        each unless overridden.
+    _store_chunks(list[Resource], type): Bulk store for places that add a chunk at a time.
+    _checkpoint(workers) -> dict: The stored resources as plain data, for World.checkpoint.
+    _restore(state, workers): Stores the resources of a checkpoint, without overflowing.
 """
     def __init__(self, world: World) -> None:
-        self._storage: list[Resource] = []
-        self._capcity = 20
+        self._storage: deque[Resource] = deque()
+        self._capcity = self.CAPACITY
         self._world_controll = world
         self.__lock = th.RLock() # Reentrant lock.
+        if world.instrumentation is not None:
+            # Counted per place, and summed per place type.
+            self.__lock = world.instrumentation.lock(
+                'places', world.instrumentation.instance(repr(self)), self.__lock,
+                rollup= ('place_types', repr(self)))
 
     @property
     def handle_resource(self):
         raise NotImplementedError
 
+    @property
+    def kind(self) -> str:
+        return str(type(self).__name__)
+
+    @property
+    def _lock(self) -> th.RLock:
+        return self.__lock
+
     def store(self, resource: Resource):
         self.__lock.acquire()
         self._store(resource)
         self.__lock.release()
 
+    def store_many(self, resources: Iterable[Resource]):
+        "Store the resources in order, taking the lock once."
+        self.__lock.acquire()
+        self._store_many(list(resources))
+        self.__lock.release()
+
     @abstractmethod
     def _store(self, resource: Resource): ...
 
+    def _store_many(self, resources: list[Resource]):
+        for resource in resources:
+            self._store(resource)
+
+    CAPACITY = 20
+
     @property
     def capacity(self) -> int:
         raise NotImplementedError
 
+    def _set_capacity(self, capacity: int):
+        self._capcity = capacity
+
     @abstractmethod
     def __len__(self): ...
 
@@ -547,9 +1230,52 @@ Methods:
         self.__lock.release()
         return resource
 
+    def retrieve_many(self, amount: int) -> list[Resource]:
+        "Retrieve up to amount resources (fewer if the place runs out), taking the lock once."
+        self.__lock.acquire()
+        resources = self._retrieve_many(min(amount, len(self)))
+        self.__lock.release()
+        return resources
+
     @abstractmethod
     def _retrieve(self) -> Resource: ...
 
+    def _retrieve_many(self, amount: int) -> list[Resource]:
+        return [self._retrieve() for _ in range(amount)]
+
+    def _store_chunks(self, resources: list[Resource], resource_type: type):
+        """
+        Store the resources in chunks, a chunk fills the storage up to the point where
+        a single store would find it overflowing, so the overflow is handled at the same
+        points as storing them one by one, and the totals are changed once per chunk.
+        """
+        if not all(isinstance(resource, resource_type) for resource in resources):
+            raise TypeError()
+        if self._world_controll.adaptive_capacity:
+            # The overflow is only flagged, it is rebalanced at the end of the day.
+            self._add_chunk(resources)
+            self._world_controll.resource_changed(self, len(resources))
+            if len(self) > self._capcity:
+                self._world_controll.overflowing_resource([self])
+            return
+        stored = 0
+        while stored < len(resources):
+            if len(self) > self._capcity:
+                self._world_controll.overflowing_resource([self])
+            chunk = resources[stored:stored + max(1, self._capcity + 1 - len(self))]
+            self._add_chunk(chunk)
+            self._world_controll.resource_changed(self, len(chunk))
+            stored += len(chunk)
+
+    def _add_chunk(self, resources: list[Resource]):
+        raise NotImplementedError
+
+    def _checkpoint(self, workers: dict[Worker, int]) -> dict:
+        raise NotImplementedError
+
+    def _restore(self, state: dict, workers: list[Worker]):
+        raise NotImplementedError
+
 
 class Barack(Place):
     """
@@ -562,22 +1288,32 @@ handeling the overflow through the world model.
 The Barack class is specifically designed to manage Workers as a waiting space,
 untill the workers are fetched from any transition facillity.
 
+Dead workers are not searched for, a worker reports its own death (a worker can be
+stored more than once, Dining stores the worker it fed twice, the copies are the same
+worker), the Barack counts it and removes it lazily when it is
+retrieved or when the dead are more than half of the storage.
+
 Attributes:
     _world_controll (World): Reference to the world/model simulation controller.
     capacity (int): The maximum storage capacity of the Barack.
     handle_resource (str): Specifies the type of resource the Barack manages ("Worker").
+    _dead (int): Amount of dead workers still in storage.
 
 Methods:
     __str__ (): Returns a string representation of the workers in the Barack.
-    _retrieve () -> Worker: Retrieves the first Worker in storage. (FIFO)
-    __check_living (): Checks for non-living workers and removes them from storage.
-    __len__ () -> int: Returns the number of living Worker items in storage.
+    _retrieve () -> Worker: Retrieves the first living Worker in storage. (FIFO)
+    living_changed (Worker): Called by a stored worker that died or was revived.
+    _count_living (Worker): Updates the dead count with the workers living status.
+    _leave (Worker) -> bool: A copy of the worker leaves, True if it was alive.
+    __remove_dead (): Removes the dead workers from storage.
+    __len__ () -> int: Returns the number of living Worker items in storage, O(1).
     _store (Worker): Adds a Worker to storage, but also managing capacity, and 
     resource overflow.
 """
     def __init__(self, world: World) -> None:
         super().__init__(world)
         self._world_controll = world
+        self._dead = 0
 
     def __str__(self) -> str:
         return "Workers in barack: "
@@ -592,24 +1328,65 @@ Methods:
 
 
     def _retrieve(self) -> Worker:
-        assert len(self._storage) > 0
-        return self._storage.pop(0) # FIFO - First in first out.
-
-    def __check_living(self):
-        for index, worker in enumerate(self._storage):
-            if not worker.is_alive:
-                self._storage.pop(index)
-
-        for index, worker in enumerate(self._storage):
-            worker: Worker
+        assert len(self) > 0
+        while True:
+            worker: Worker = self._storage.popleft() # FIFO - First in first out.
+            if self._leave(worker):
+                return worker
+
+    def living_changed(self, worker: Worker):
+        "A worker stored here has died or been revived."
+        with self._lock:
+            self._count_living(worker)
+
+    def _count_living(self, worker: Worker):
+        # Home state is stored copies * 2 + 1 if they are counted as dead.
+        copies, counted_dead = divmod(worker._home_state(self), 2)
+        if copies and counted_dead == worker.is_alive:
+            self._dead += -copies if counted_dead else copies
+            worker._set_home_state(self, copies * 2 + (not worker.is_alive))
+            self._world_controll.resource_changed(self, copies if counted_dead else -copies)
+
+    def _leave(self, worker: Worker) -> bool:
+        "A copy of the worker leaves the storage, return True if it was alive."
+        self._count_living(worker)
+        copies, counted_dead = divmod(worker._home_state(self), 2)
+        if counted_dead:
+            self._dead -= 1
+        else:
+            self._world_controll.resource_changed(self, -1)
+        copies -= 1
+        worker._set_home_state(self, copies * 2 + counted_dead if copies else 0)
+        return not counted_dead
+
+    def __remove_dead(self):
+        living = [worker for worker in self._storage if worker.is_alive]
+        for worker in self._storage:
             if not worker.is_alive:
-                self._storage.pop(index)
+                self._leave(worker)
+        # Keep the living workers, in the same order.
+        self._storage.clear()
+        self._storage.extend(living)
 
     def __len__(self):
-        self.__check_living()
-        if len(self._storage) <= 0:
-            return 0
-        return len(self._storage)
+        return len(self._storage) - self._dead
+
+    def _checkpoint(self, workers: dict[Worker, int]) -> dict:
+        # Also the dead, they count when the storage overflows until they are removed.
+        with self._lock:
+            return {'workers': array('I', [workers.setdefault(worker, len(workers))
+                                           for worker in self._storage]).tobytes()}
+
+    def _restore(self, state: dict, workers: list[Worker]):
+        indices = array('I')
+        indices.frombytes(state['workers'])
+        for index in indices:
+            worker = workers[index]
+            self._storage.append(worker)
+            worker._set_home_state(self, worker._home_state(self) + 2)
+        self._world_controll.resource_changed(self, len(indices))
+        for index in set(indices):
+            self._count_living(workers[index]) # Counts the dead.
 
     def _store(self, resource: Worker):
         # control the attribut, before storing.
@@ -620,7 +1397,299 @@ Methods:
             self._world_controll.overflowing_resource([self])
         if resource.is_alive:
             self._storage.append(resource)
-            self.__check_living()
+            self._count_living(resource)
+            # Alive, so the copies are counted as living after _count_living.
+            resource._set_home_state(self, resource._home_state(self) + 2)
+            self._world_controll.resource_changed(self, 1)
+
+        if self._dead > len(self._storage) // 2:
+            self.__remove_dead()
+
+class Cohorts:
+    """
+Cohorts are workers taken out of a CohortBarack in bulk, without a Worker object per
+worker: (longevity, count, worker) in FIFO order, worker is the shared Worker of copies
+stored more than once (None otherwise, the longevity is the worker). Cohorts are sliced
+and counted by worker, so the world moves them as a list of workers, and a CohortBarack
+stores them in bulk. Iterating gives the workers, e.g. to store them in a Barack.
+
+Attributes:
+    entries (tuple[tuple[int, int, Worker], ...]): (longevity, count, worker) in FIFO order.
+"""
+    __slots__ = ('entries', '__amount')
+
+    def __init__(self, entries: Iterable[tuple[int, int, 'Worker']] = ()) -> None:
+        self.entries = tuple(entries)
+        self.__amount = sum(count for _, count, _ in self.entries)
+
+    def __len__(self):
+        return self.__amount
+
+    def __getitem__(self, index: slice) -> 'Cohorts':
+        "The workers start:stop, as cohorts."
+        start, stop, _ = index.indices(self.__amount)
+        entries, position = [], 0
+        for longevity, count, worker in self.entries:
+            low, high = max(start, position), min(stop, position + count)
+            if low < high:
+                entries.append((longevity, high - low, worker))
+            position += count
+        return Cohorts(entries)
+
+    def __iter__(self):
+        for longevity, count, worker in self.entries:
+            for _ in range(count):
+                yield worker if worker is not None else Worker(longevity= longevity)
+
+
+class CohortBarack(Barack):
+    """
+CohortBarack is a Barack for very large settlements, that does not keep the Worker
+objects. A worker is only its longevity (0 to 100), so the Barack keeps a FIFO of
+cohorts, [longevity, count, None] of workers stored one after another with the same
+longevity, and a histogram of the workers per longevity.
+
+A stored worker is counted in its cohort, a retrieved worker is a new Worker with the
+longevity of the first cohort, so the transitions work with it as with a Barack.
+A worker stored more than once (Dining stores the worker it fed twice) is kept as
+[0, copies, worker] instead, the copies share the worker's longevity and are counted
+dead when it dies, with the liveness index of the Barack, so a world runs the same
+with either Barack. The copies of a worker are only known as such when it is stored
+again right after (or already has copies stored), with the 'threads' runtime another
+store in between makes them two workers.
+
+Moving workers between CohortBaracks (an overflowing Barack, adaptive capacity) is
+O(cohorts): retrieve_many gives Cohorts instead of workers, and store_many stores them.
+
+The world keys it as a 'Barack' (kind), it is created by World(cohort_barack=True).
+
+Attributes:
+    __cohorts (deque[list]): [longevity, count, worker] of the stored workers, in FIFO order.
+    __histogram (list[int]): Amount of stored workers per longevity, 0 to 100, without
+        the copies of shared workers.
+    __amount (int): Amount of stored workers, also the dead copies not yet removed.
+    __last (Worker): The last stored worker, while its cohort is the last one.
+    __last_cohort (list): The cohort of the last stored worker.
+
+Methods:
+    kind (str): 'Barack', the place type of the world.
+    histogram (tuple[int, ...]): Amount of living stored workers per longevity.
+    _store (Worker): Counts a living worker in the last cohort, or a new one.
+    _retrieve () -> Worker: A worker of the first cohort (FIFO).
+    retrieve_cohorts(amount) -> Cohorts: Retrieves up to amount workers as cohorts,
+        taking the lock once.
+    store_cohorts(Cohorts): Stores the cohorts in order, taking the lock once.
+    store_many(resources): Stores Cohorts with store_cohorts, workers one by one.
+    __len__ () -> int: Amount of living stored workers, O(1).
+"""
+    def __init__(self, world: World) -> None:
+        super().__init__(world)
+        self.__cohorts: deque[list] = deque()
+        self.__histogram = [0] * 101
+        self.__amount = 0
+        self.__last: Worker = None
+        self.__last_cohort: list = None
+
+    @property
+    def kind(self) -> str:
+        return 'Barack'
+
+    @property
+    def histogram(self) -> tuple[int, ...]:
+        with self._lock:
+            histogram = list(self.__histogram)
+            for _, count, worker in self.__cohorts:
+                if worker is not None and worker.is_alive:
+                    histogram[worker.longevity] += count
+        return tuple(histogram)
+
+    def __add(self, longevity: int, count: int):
+        if self.__cohorts and self.__cohorts[-1][0] == longevity and self.__cohorts[-1][2] is None:
+            self.__cohorts[-1][1] += count
+        else:
+            self.__cohorts.append([longevity, count, None])
+        self.__histogram[longevity] += count
+        self.__amount += count
+
+    def __share(self, worker: Worker, count: int):
+        "Store count copies of the worker, sharing its longevity."
+        if self.__cohorts and self.__cohorts[-1][2] is worker:
+            self.__cohorts[-1][1] += count
+        else:
+            self.__cohorts.append([0, count, worker])
+        self.__amount += count
+        # Alive, so the copies are counted as living after _count_living.
+        self._count_living(worker)
+        worker._set_home_state(self, worker._home_state(self) + 2 * count)
+
+    def _store(self, resource: Worker):
+        # control the attribut, before storing.
+        if not isinstance(resource, Worker):
+            raise TypeError()
+
+        if self.__amount > self._capcity:
+            self._world_controll.overflowing_resource([self])
+        if resource.is_alive:
+            if self.__last is resource and self.__cohorts and self.__cohorts[-1] is self.__last_cohort:
+                # Stored again right after, the first copy is the last one of its cohort.
+                cohort = self.__last_cohort
+                if cohort[2] is None:
+                    cohort[1] -= 1
+                    self.__histogram[cohort[0]] -= 1
+                    self.__amount -= 1
+                    if cohort[1] == 0:
+                        self.__cohorts.pop()
+                    self.__share(resource, 2)
+                else:
+                    self.__share(resource, 1)
+            elif resource._baracks():
+                self.__share(resource, 1) # Copies stored in other baracks.
+            else:
+                self.__add(resource.longevity, 1)
+            self.__last, self.__last_cohort = resource, self.__cohorts[-1]
+            self._world_controll.resource_changed(self, 1)
+
+        if self._dead > self.__amount // 2:
+            self.__remove_dead()
+
+    def __remove_dead(self):
+        cohorts = deque()
+        for cohort in self.__cohorts:
+            longevity, count, worker = cohort
+            if worker is not None and not worker.is_alive:
+                for _ in range(count):
+                    self._leave(worker)
+                self.__amount -= count
+            else:
+                cohorts.append(cohort)
+        self.__cohorts = cohorts
+
+    def _retrieve(self) -> Worker:
+        assert len(self) > 0
+        while True:
+            cohort = self.__cohorts[0] # FIFO - First in first out.
+            longevity, _, worker = cohort
+            cohort[1] -= 1
+            if cohort[1] == 0:
+                self.__cohorts.popleft()
+            self.__amount -= 1
+            if worker is None:
+                self.__histogram[longevity] -= 1
+                self._world_controll.resource_changed(self, -1)
+                return Worker(longevity= longevity)
+            if self._leave(worker):
+                return worker
+
+    def _retrieve_many(self, amount: int) -> Cohorts:
+        return self.__retrieve_cohorts(amount)
+
+    def retrieve_cohorts(self, amount: int) -> Cohorts:
+        "Retrieve up to amount workers as cohorts in FIFO order, taking the lock once."
+        with self._lock:
+            return self.__retrieve_cohorts(min(amount, len(self)))
+
+    def __retrieve_cohorts(self, amount: int) -> Cohorts:
+        entries = []
+        retrieved = 0 # Workers without a shared worker, the others leave one by one.
+        while amount:
+            cohort = self.__cohorts[0]
+            longevity, count, worker = cohort
+            if worker is not None and not worker.is_alive:
+                # Dead copies are dropped, as _retrieve skips them.
+                self.__cohorts.popleft()
+                self.__amount -= count
+                for _ in range(count):
+                    self._leave(worker)
+                continue
+            taken = min(amount, count)
+            cohort[1] -= taken
+            if cohort[1] == 0:
+                self.__cohorts.popleft()
+            self.__amount -= taken
+            if worker is None:
+                self.__histogram[longevity] -= taken
+                retrieved += taken
+            else:
+                for _ in range(taken):
+                    self._leave(worker)
+            entries.append((longevity, taken, worker))
+            amount -= taken
+        self._world_controll.resource_changed(self, -retrieved)
+        return Cohorts(entries)
+
+    def store_many(self, resources: Iterable[Worker]):
+        "Store the resources in order, Cohorts in bulk, taking the lock once."
+        if isinstance(resources, Cohorts):
+            self.store_cohorts(resources)
+        else:
+            super().store_many(resources)
+
+    def store_cohorts(self, cohorts: Cohorts):
+        """
+        Store the cohorts in order, taking the lock once. A cohort is stored in chunks
+        as in Place._store_chunks, so the overflow (and the removal of the dead) is
+        handled at the same points as storing the workers one by one.
+        """
+        with self._lock:
+            self.__last = None
+            for longevity, count, worker in cohorts.entries:
+                if worker is not None:
+                    # Still shared, the worker may have no other copies stored right now.
+                    for _ in range(count):
+                        if self.__amount > self._capcity:
+                            self._world_controll.overflowing_resource([self])
+                        if worker.is_alive:
+                            self.__share(worker, 1)
+                            self._world_controll.resource_changed(self, 1)
+                        if self._dead > self.__amount // 2:
+                            self.__remove_dead()
+                    continue
+                while count:
+                    if self._world_controll.adaptive_capacity:
+                        chunk = count # The overflow is only flagged.
+                    else:
+                        chunk = min(count, max(1, self._capcity + 1 - self.__amount))
+                    if self._dead > (self.__amount + 1) // 2:
+                        chunk = 1 # The first store removes the dead.
+                    if self.__amount + chunk - 1 > self._capcity:
+                        self._world_controll.overflowing_resource([self])
+                    self.__add(longevity, chunk)
+                    self._world_controll.resource_changed(self, chunk)
+                    count -= chunk
+                    if self._dead > self.__amount // 2:
+                        self.__remove_dead()
+
+    def __len__(self):
+        return self.__amount - self._dead
+
+    def _checkpoint(self, workers: dict[Worker, int]) -> dict:
+        # A shared worker is saved once, as in a Barack, its cohort refers to it by index + 1.
+        values = array('I')
+        with self._lock:
+            for longevity, count, worker in self.__cohorts:
+                index = 0 if worker is None else workers.setdefault(worker, len(workers)) + 1
+                values.extend((longevity, count, index))
+        return {'entries': values.tobytes()}
+
+    def _restore(self, state: dict, workers: list[Worker]):
+        values = array('I')
+        values.frombytes(state['entries'])
+        shared = set()
+        for longevity, count, index in zip(values[::3], values[1::3], values[2::3]):
+            if index:
+                worker = workers[index - 1]
+                self.__cohorts.append([0, count, worker])
+                self.__amount += count
+                worker._set_home_state(self, worker._home_state(self) + 2 * count)
+                shared.add(worker)
+            else:
+                self.__cohorts.append([longevity, count, None])
+                self.__histogram[longevity] += count
+                self.__amount += count
+        self._world_controll.resource_changed(self, self.__amount)
+        for worker in shared:
+            self._count_living(worker) # Counts the dead.
+
 
 class Warehouse(Place):
     """
@@ -631,22 +1700,31 @@ This class inherits from the Place class and is designed to store and manage Pro
 It includes methods to add and retrieve Product entities, handle storage capacity, 
 and interact with the world/modell simulation controller to address overflow situations.
 The Warehouse class is specialized for managing Product resources.
+Products are fungible tokens, so the Warehouse only counts them, retrieving gives
+back a shared Product token (any order is LIFO for identical products).
 
 Attributes:
     _world_controll (World): Reference to the world/model simulation controller.
     handle_resource (str): Specifies the type of resource the Warehouse manages ("Product").
     capacity (int): Maximum capacity of the Warehouse for storing Product items.
+    __amount (int): Amount of products in storage.
+    __token (Product): The product token given back on retrieve.
 
 Methods:
     __str__ (): Returns a string representation of products in the Warehouse.
     _retrieve () -> Product: Retrieves the most recently stored Product item (LIFO).
     _store (Product): Adds a Product to storage, managing capacity and overflow.
+    _retrieve_many (amount) -> list[Product]: Retrieves amount products at once.
+    _store_many (list[Product]): Adds the products a chunk at a time.
     __len__ () -> int: Returns the current number of Product items in storage.
 """
 
+    __token = Product()
+
     def __init__(self, world: World) -> None:
         super().__init__(world)
         self._world_controll = world
+        self.__amount = 0
 
     @property
     def handle_resource(self):
@@ -660,22 +1738,41 @@ Methods:
         return "Products in warehouse: "
 
     def _retrieve(self) -> Product:
-        assert len(self._storage) > 0
-        return self._storage.pop() # LIFO - Last in First out.
+        assert self.__amount > 0
+        self.__amount -= 1 # LIFO - Last in First out.
+        self._world_controll.resource_changed(self, -1)
+        return self.__token
 
     def _store(self, resource: Product):
         # control the attribut, before storing.
         if not isinstance(resource, Product):
             raise TypeError()
 
-        if len(self._storage) > self._capcity:
+        if self.__amount > self._capcity:
             self._world_controll.overflowing_resource([self])
-        self._storage.append(resource)
+        self.__amount += 1
+        self._world_controll.resource_changed(self, 1)
+
+    def _retrieve_many(self, amount: int) -> list[Product]:
+        self.__amount -= amount # LIFO - Last in First out.
+        self._world_controll.resource_changed(self, -amount)
+        return [self.__token] * amount
+
+    def _store_many(self, resources: list[Product]):
+        self._store_chunks(resources, Product)
+
+    def _add_chunk(self, resources: list[Product]):
+        self.__amount += len(resources)
+
+    def _checkpoint(self, workers: dict[Worker, int]) -> dict:
+        return {'products': self.__amount}
+
+    def _restore(self, state: dict, workers: list[Worker]):
+        self.__amount = state['products']
+        self._world_controll.resource_changed(self, self.__amount)
 
     def __len__(self):
-        if len(self._storage) <= 0:
-            return 0
-        return len(self._storage)
+        return self.__amount
 
 
 class Barn(Place):
@@ -697,6 +1794,8 @@ Methods:
     __repr__ (): Provides representation of the Barn object.
     _retrieve () -> Food: Retrieves the first Food item in storage (FIFO).
     _store (Food): Adds a Food resource to storage, managing capacity and overflow.
+    _retrieve_many (amount) -> list[Food]: Retrieves the first amount Food items.
+    _store_many (list[Food]): Adds the Food a chunk at a time.
     __len__ () -> int: Returns the current number of Food items in storage.
 """
     def __init__(self, world: World) -> None:
@@ -719,7 +1818,8 @@ Methods:
 
     def _retrieve(self) -> Food:  # FIFO
         assert len(self._storage) > 0
-        return self._storage.pop(0) # FIFO - First in first out.
+        self._world_controll.resource_changed(self, -1)
+        return self._storage.popleft() # FIFO - First in first out.
 
     def _store(self, resource: Food):
         # control the attribut, before storing.
@@ -729,6 +1829,25 @@ Methods:
         if len(self._storage) > self._capcity:
             self._world_controll.overflowing_resource([self])
         self._storage.append(resource)
+        self._world_controll.resource_changed(self, 1)
+
+    def _retrieve_many(self, amount: int) -> list[Food]:
+        self._world_controll.resource_changed(self, -amount)
+        return [self._storage.popleft() for _ in range(amount)] # FIFO
+
+    def _store_many(self, resources: list[Food]):
+        self._store_chunks(resources, Food)
+
+    def _add_chunk(self, resources: list[Food]):
+        self._storage.extend(resources)
+
+    def _checkpoint(self, workers: dict[Worker, int]) -> dict:
+        with self._lock:
+            return {'food': bytes(food.quality for food in self._storage)}
+
+    def _restore(self, state: dict, workers: list[Worker]):
+        self._storage.extend(Food(quality) for quality in state['food'])
+        self._world_controll.resource_changed(self, len(state['food']))
 
     def __len__(self):
         if len(self._storage) == 0:
@@ -736,6 +1855,146 @@ Methods:
         return len(self._storage)
 
 
+class BucketBarn(Barn):
+    """
+BucketBarn is a Barn that counts the food per quality (0 to 100) instead of keeping the
+Food objects, a retrieved Food is the shared (interned) Food of its quality. The food
+is served by a policy, for studying food poisoning (the food.quality - 30 of Dining):
+
+    'fifo': In the order it was stored, as a Barn (runs of food of the same quality).
+    'best': The best food first.
+    'worst': The worst food first.
+
+Storing and retrieving is O(1), at most a walk over the 101 quality levels for 'best'
+and 'worst'. The world keys it as a 'Barn' (kind), it is created by World(barn_policy=...).
+
+Attributes:
+    POLICIES (tuple[str, ...]): The serving policies.
+    __foods (tuple[Food, ...]): The interned Food of every quality.
+    __policy (str): The serving policy, the world's barn_policy.
+    __runs (deque[list[int]]): [quality, count] of the stored food in FIFO order, 'fifo' only.
+    __counts (list[int]): Amount of stored food per quality.
+    __amount (int): Amount of stored food.
+    __best (int): No food is better than this quality ('best' only).
+    __worst (int): No food is worse than this quality ('worst' only).
+
+Methods:
+    kind (str): 'Barn', the place type of the world.
+    policy (str): The serving policy.
+    histogram (tuple[int, ...]): Amount of stored food per quality.
+    _store (Food): Counts the food in its quality.
+    _retrieve () -> Food: The next food by the policy.
+    _retrieve_many (amount) -> list[Food]: The next amount food by the policy.
+    __len__ () -> int: Amount of stored food, O(1).
+"""
+    POLICIES = ('fifo', 'best', 'worst')
+
+    __foods = tuple(Food(quality) for quality in range(101))
+
+    def __init__(self, world: World) -> None:
+        super().__init__(world)
+        self.__policy = world.barn_policy or 'fifo'
+        self.__runs: deque[list[int]] = deque()
+        self.__counts = [0] * 101
+        self.__amount = 0
+        self.__best = 0
+        self.__worst = 100
+
+    @property
+    def kind(self) -> str:
+        return 'Barn'
+
+    @property
+    def policy(self) -> str:
+        return self.__policy
+
+    @property
+    def histogram(self) -> tuple[int, ...]:
+        return tuple(self.__counts)
+
+    def __add(self, quality: int, count: int):
+        quality = max(quality, 0)
+        if self.__policy == 'fifo':
+            if self.__runs and self.__runs[-1][0] == quality:
+                self.__runs[-1][1] += count
+            else:
+                self.__runs.append([quality, count])
+        self.__best = max(self.__best, quality)
+        self.__worst = min(self.__worst, quality)
+        self.__counts[quality] += count
+        self.__amount += count
+
+    def __take(self, amount: int) -> list[tuple[int, int]]:
+        "Take amount food by the policy, as (quality, count)."
+        taken = []
+        left = amount
+        while left:
+            if self.__policy == 'fifo':
+                run = self.__runs[0] # FIFO - First in first out.
+                quality, count = run[0], min(left, run[1])
+                run[1] -= count
+                if run[1] == 0:
+                    self.__runs.popleft()
+            else:
+                if self.__policy == 'best':
+                    while self.__counts[self.__best] == 0:
+                        self.__best -= 1
+                    quality = self.__best
+                else:
+                    while self.__counts[self.__worst] == 0:
+                        self.__worst += 1
+                    quality = self.__worst
+                count = min(left, self.__counts[quality])
+            self.__counts[quality] -= count
+            taken.append((quality, count))
+            left -= count
+        self.__amount -= amount
+        self._world_controll.resource_changed(self, -amount)
+        return taken
+
+    def _retrieve(self) -> Food:
+        assert self.__amount > 0
+        return self.__foods[self.__take(1)[0][0]]
+
+    def _retrieve_many(self, amount: int) -> list[Food]:
+        return [self.__foods[quality] for quality, count in self.__take(amount)
+                for _ in range(count)]
+
+    def _store(self, resource: Food):
+        # control the attribut, before storing.
+        if not isinstance(resource, Food):
+            raise TypeError()
+
+        if self.__amount > self._capcity:
+            self._world_controll.overflowing_resource([self])
+        self.__add(resource.quality, 1)
+        self._world_controll.resource_changed(self, 1)
+
+    def _add_chunk(self, resources: list[Food]):
+        for food in resources:
+            self.__add(food.quality, 1)
+
+    def _checkpoint(self, workers: dict[Worker, int]) -> dict:
+        with self._lock:
+            if self.__policy == 'fifo':
+                runs = [value for run in self.__runs for value in run]
+            else:
+                runs = [value for quality, count in enumerate(self.__counts) if count
+                        for value in (quality, count)]
+            return {'policy': self.__policy, 'runs': array('I', runs).tobytes()}
+
+    def _restore(self, state: dict, workers: list[Worker]):
+        self.__policy = state['policy']
+        values = array('I')
+        values.frombytes(state['runs'])
+        for quality, count in zip(values[::2], values[1::2]):
+            self.__add(quality, count)
+        self._world_controll.resource_changed(self, self.__amount)
+
+    def __len__(self):
+        return self.__amount
+
+
 #############################
 #       Transitions         #
 #############################
@@ -749,10 +2008,17 @@ This class extends Python's Thread class, enabling it to manage independent proc
 the world model. It sets up the control flow for derived classes through abstract methods, 
 and allows specific behaviors. The class controls resource fetching for subclasses,
 and manages thread lifecycle events (start, pause, continue, and stop).
+With the 'pool' runtime of the world the thread is never started, tick() is submitted
+to the world's pool as a work item instead. With the 'events' runtime the thread is not
+started either, the firings are scheduled every duration() simulated days. With the
+'asyncio' runtime tick_async() is awaited by the world's tick_async().
 
 Attributes:
     _world_controller (World): Reference to the world/model simulation controller.
+    _random (Random): This transition's own random stream, from the world.
+    _instrumentation (Instrumentation): The world's instrumentation, None when disabled.
     __max_amount (int): Maximum amount of transitons for that transtion type.
+    DURATION (float): Mean simulated days between firings, for the 'events' runtime.
     _running (bool): Control flag for managing the thread lifecycle.
     continue_event (Event): Threading event to manage when the thread should work.
     finish_event (Event): Threading event indicating that it is finished 
@@ -767,6 +2033,12 @@ Methods:
     connect_in (Place): Connects an input resource location to the transition.
     connect_out (Place): Connects an output resource location to the transition.
     tick (): Executes the core operation defined in the subclass `_tick` method.
+    tick_async (): The tick as a coroutine, for the world's 'asyncio' runtime.
+    duration () -> float: Simulated days until the next firing (DURATION, +-50%).
+    connections (dict[str, Place]): The connected places, by attribute name.
+    _checkpoint (place_index, next_firing) -> dict: Random stream, _PARAMETERS and
+        connections as plain data, for World.checkpoint.
+    _restore (state, places): Sets the random stream, parameters and connections.
     continue_run (): Signals the thread/this transition to resume it's work.
     finish (): Called when the transition/thread is finished.
     thread_work_finished (bool): Returns True if finish_event is set.
@@ -778,6 +2050,8 @@ Methods:
     def __init__(self, world: World) -> None:
         super().__init__()  # Initialize the Thread superclass.
         self._world_controller = world
+        self._random = world.spawn_random()
+        self._instrumentation = world.instrumentation
         self.__max_amount = 50
         self._running = True  # Control flag for the thread.
 
@@ -785,10 +2059,45 @@ Methods:
         self.continue_event = th.Event()
         self.finish_event = th.Event()
 
+    DURATION = 1.0
+
     @property
     def max_amount(self):
         return self.__max_amount
 
+    def duration(self) -> float:
+        return self.DURATION * self._random.uniform(0.5, 1.5)
+
+    # Parameters drawn when the transition is created, saved in a checkpoint.
+    _PARAMETERS: tuple[str, ...] = ()
+
+    @property
+    def connections(self) -> dict[str, Place]:
+        "The connected places by attribute name, '_in_barack', '_out_barn' and so on."
+        return {name: place for name, place in vars(self).items()
+                if name.startswith(('_in_', '_out_')) and isinstance(place, Place)}
+
+    def _checkpoint(self, place_index: dict[Place, tuple[str, int]],
+                    next_firing: float = None) -> dict:
+        connections = {name: place_index[place] for name, place in self.connections.items()
+                       if place in place_index}
+        return {
+            'random': self._random.getstate(),
+            'parameters': {name: getattr(self, name) for name in self._PARAMETERS},
+            'connections': connections,
+            'next_firing': next_firing,
+        }
+
+    def _restore(self, state: dict, places: dict[str, list[Place]]):
+        self._random.setstate(state['random'])
+        for name, value in state['parameters'].items():
+            setattr(self, name, value)
+        for name, (key, index) in state['connections'].items():
+            if name.startswith('_in_'):
+                self.connect_in(places[key][index])
+            else:
+                self.connect_out(places[key][index])
+
     @property
     @abstractmethod
     def c_in_blueprint(self) -> list[Place]:
@@ -829,7 +2138,17 @@ Methods:
         return str(type(self).__name__)
 
     def tick(self):
-        self._tick()
+        if self._instrumentation is None:
+            self._tick()
+        else:
+            with self._instrumentation.tick('transitions', repr(self)):
+                self._tick()
+
+    async def tick_async(self):
+        # A tick never awaits inside, so the places are consistent for the other
+        # coroutines, they get their turn after it.
+        self.tick()
+        await asyncio.sleep(0)
 
     def _tick(self):
         raise NotImplementedError(self)
@@ -901,11 +2220,13 @@ Methods:
     _connect_in (Place): Connects input facilities to the factory.
     _connect_out (Place): Connects output facilities to the factory.
 """
+    _PARAMETERS = ('_longevity_cost', '_accident_prob')
+
     def __init__(self, world: World) -> None:
         super().__init__(world)
         self._world_controller = world
-        self._longevity_cost: int = random.randint(5, 15)
-        self._accident_prob = random.randint(3, 6)
+        self._longevity_cost: int = self._random.randint(5, 15)
+        self._accident_prob = self._random.randint(3, 6)
         self.__producer_of = Product
 
         # Places.
@@ -932,7 +2253,7 @@ Methods:
             self._world_controller.lack_of_resources(self, [self._in_barack])
             return
 
-        if random.randint(1, 10) > self._accident_prob:
+        if self._random.randint(1, 10) > self._accident_prob:
             worker.longevity_change(-100)
             # print("Accident")
         else:
@@ -940,8 +2261,7 @@ Methods:
 
         if worker.is_alive:
             self.__send_result(worker)
-            # world.decrease_prio(self.producer_of, self)
-            this_world.decrease_prio(self)
+            self._world_controller.decrease_prio(self)
 
     def _fetchable_resource(self, in_connection: Place) -> bool:
         return len(in_connection) > 0
@@ -1120,7 +2440,7 @@ Methods:
             self._world_controller.lack_of_resources(self, [self._in_warehouse, self._in_barack])
             return
 
-        self.__hometype = bool(random.randint(0, 1))  # True | False
+        self.__hometype = bool(self._random.randint(0, 1))  # True | False
 
         worker: Worker = self._in_barack.retrieve()
         self._in_warehouse.retrieve()  # Get a product, and destroy it
@@ -1128,9 +2448,8 @@ Methods:
         # Either get a healthier worker or 1 new worker.
         if self.__hometype and len(self._in_barack) > 1:
             worker2 = self._in_barack.retrieve()
-            self._out_barack.store(worker)
-            self._out_barack.store(worker2)
-            self._out_barack.store(Worker())  # The worker's child
+            # The workers and the worker's child.
+            self._out_barack.store_many([worker, worker2, Worker(self._random)])
             self._world_controller.decrease_prio(self)
         else:
             worker.longevity_change(5)
@@ -1169,10 +2488,12 @@ Methods:
     __send_result (Worker): Sends produced resources to the output facilities.
     _fetchable_resource (Place): Checks if resources are available from the input connection.
 """
+    _PARAMETERS = ('_accident_prob',)
+
     def __init__(self, world: World) -> None:
         super().__init__(world)
         self._world_controller = world
-        self._accident_prob = random.randint(3, 6)
+        self._accident_prob = self._random.randint(3, 6)
         self.__producer_of = Food
 
         # Places.
@@ -1215,15 +2536,15 @@ Methods:
             self._world_controller.lack_of_resources(self, [self._in_barack])
             return
 
-        if random.randint(1, 10) < self._accident_prob:
-            worker.longevity_change(-random.randint(10, 70))
+        if self._random.randint(1, 10) < self._accident_prob:
+            worker.longevity_change(-self._random.randint(10, 70))
 
         if worker.is_alive:
             self.__send_result(worker)
             self._world_controller.decrease_prio(self)
 
     def __send_result(self, worker: Worker):
-        self._out_barn.store(Food(initial_quality=random.randint(20, 100)))
+        self._out_barn.store(Food(initial_quality=self._random.randint(20, 100)))
         self._out_barack.store(worker)
 
     def _fetchable_resource(self, in_connection: Place) -> bool:
@@ -1236,7 +2557,21 @@ if __name__ == "__main__":
     STARTING_SETTLEMENT = 1000  # 40
     STARTING_RESOURCES = 1000   # 80
     SLEEP_TIME = 0
-    this_world = World(STARTING_SETTLEMENT, STARTING_RESOURCES, SLEEP_TIME)
+    ENGINE = 'threads'  # 'threads' (reference) | 'vectorized' (NumPy)
+    RUNTIME = 'threads' # 'threads' (thread per transition) | 'pool' | 'events' | 'asyncio'
+    SEED = None         # Same seed (with RUNTIME 'pool' and 1 thread) replays a run.
+    REPORT_EVERY = 1    # Print the result every REPORT_EVERY days.
+
+    REPORTER = ConsoleReporter(every_days= REPORT_EVERY, sleep_time= SLEEP_TIME)
+
+    if ENGINE == 'vectorized':
+        from simsims_vectorized import VectorizedWorld
+        this_world = VectorizedWorld(STARTING_SETTLEMENT, STARTING_RESOURCES, SLEEP_TIME,
+                                     seed= SEED, reporter= REPORTER)
+    else:
+        this_world = World(STARTING_SETTLEMENT, STARTING_RESOURCES, SLEEP_TIME, RUNTIME,
+                           pool_size= 1 if SEED is not None else 4, seed= SEED,
+                           reporter= REPORTER)
 
     while not ENDOFTHEWORLD:
         ENDOFTHEWORLD = this_world.tick()
@@ -1,12 +1,22 @@
 "Module for creating, saving exporting and plotting data from and to a database."
+import csv
 import os
+import queue
 import sqlite3
+import subprocess
+import sys
+import threading as th
+import time
 from sqlite3 import Error
 import datetime as dt
+import json
+from itertools import groupby
+from operator import itemgetter
 import pandas as pd
 from openpyxl import Workbook
 from openpyxl import load_workbook
 from matplotlib import pyplot
+from matplotlib.ticker import MaxNLocator
 
 
 class SimsimsAnalytics:
@@ -16,43 +26,87 @@ class SimsimsAnalytics:
     The SimSimsAnalytics class creates a DataBase and stores the simulation 
     data of the simsims simulation. It also saves data to excel and plot
     a graph over the resource amounts in the simulation.
+    Every run is a row in the simulation_runs table (config, seed, start and
+    end time, days survived), and the days of the runs are kept in the
+    simulation_steps table keyed by (RUN_ID, DAY), so many runs (also
+    concurrent ones) share one database.
 
     Attributes:
         db_file (str): Path and name of the SQLite database file.
         table_columns (list[str]): Columns to track in the simulation.
+        buffered (bool): Queue the steps in memory and write them in batches
+            on a background thread (BufferedStepWriter), instead of one commit per step.
+        flush_rows (int): Buffered mode, write when this many steps are queued.
+        flush_interval (float): Buffered mode, write at least this often (seconds).
+        wal (bool): Use write-ahead logging for the database.
         
     Methods:
-        create_table(): Creates a table in the database.
-        drop_table(): Deletes the table from the Database.
+        create_table(): Creates the tables in the database.
+        drop_table(): Deletes the tables from the Database.
+        start_run(config, seed) -> int: Adds a run, the following steps belongs to it.
+        end_run(days_survived): Stores the end of the current run.
+        run_id (int): The current run.
+        get_runs(): Retrieves every run.
         __str__(): Returns the recent row.
-        get_rows(): Retrieves all rows from the table.
-        add_step(data): Adds a record to the table in the DB.
+        latest_step(run_id): Returns the last row of a run.
+        get_rows(run_id): Retrieves all rows of a run.
+        get_page(after_day, page_size, run_id): Retrieves the rows after a day (cursor paging).
+        iter_rows(run_id, page_size): Iterates over the rows of a run, a page at a time.
+        aggregates(run_id): Min, max, mean per column and day of peak population.
+        add_step(data, day): Adds a record to the table in the DB.
+        add_snapshot(snapshot, day): Adds the instrumentation snapshot of a day.
+        get_snapshots(run_id): Retrieves the instrumentation snapshots of a run.
+        flush(): Waits until every buffered step is written.
+        stop_writer(): Flushes and stops the background writer.
         to_excel(filename): Exports table data to an Excel file.
-        to_figure(filename): Generates a plot from the database.
+        to_excel_stream(filename, run_id): Exports a run to a new Excel file, streamed.
+        to_csv(filename, run_id): Exports a run to a CSV file, streamed.
+        to_parquet(filename, run_id): Exports a run to a Parquet file (needs pyarrow).
+        to_figure(filename, show): Generates a plot from the database (downsampled).
+        to_figure_background(filename): Generates the plot in a detached process.
     """
-    def __init__(self, db_file, table_columns = ['Worker', 'Product', 'Food']):
+    def __init__(self, db_file, table_columns = ['Worker', 'Product', 'Food'],
+                 buffered = False, flush_rows = 100, flush_interval = 0.5, wal = False):
         self._sim_id: int
-        self.__table_name = 'simulations'
+        self.__table_name = 'simulation_steps'
+        self.__runs_table_name = 'simulation_runs'
+        self.__aggregates_table_name = 'simulation_aggregates'
+        self.__instrumentation_table_name = 'simulation_instrumentation'
+        self.__run_id: int = None
+        self.__next_day = 0
+        self.__aggregates: dict = None
+        self.__aggregates_cache: dict[int, dict] = {}
         self.__folder_name = 'Loggs'
         self.__table_columns = table_columns
+        self.__db_file = db_file
+        self.__writer: BufferedStepWriter = None
 
         if '.db' not in db_file:
             db_file += '.db'
 
         try:
-            self.__db = self._create_connection(self.__getpath(self.__folder_name) + '\\' + db_file)
+            self.__db_path = self.__getpath(self.__folder_name) + '\\' + db_file
+            self.__db = self._create_connection(self.__db_path)
         except FileNotFoundError:
             print("Reatempting without the specific folder path")
+            self.__db_path = db_file
             self.__db = self._create_connection(db_file)
         self.__db_c = self.__db.cursor() # Database cursor
 
+        if wal:
+            self.__db_c.execute("PRAGMA journal_mode=WAL;")
+            self.__db_c.execute("PRAGMA synchronous=NORMAL;")
+        if buffered:
+            self.__writer = BufferedStepWriter(self.__db_path, flush_rows, flush_interval)
+
     def __getpath(self, filename):
         return os.path.join(os.path.join(os.path.dirname(__file__)), filename)
 
     def _create_connection(self, db_file = ''):
         conn = None
         try:
-            conn = sqlite3.connect(db_file)
+            # Wait for other processes writing to the same database.
+            conn = sqlite3.connect(db_file, timeout=30)
             return conn
         except Error as e:
             print(e, " with " + db_file)
@@ -60,30 +114,64 @@ class SimsimsAnalytics:
 
 
 
-    def create_table(self, table_name = 'simulations'):
-        "Create a table in the database."
+    def create_table(self, table_name = ''):
+        """
+        Create the tables in the database, the runs table and the table with
+        one row per day of a run, keyed by (RUN_ID, DAY).
+        """
         if table_name == '':
             using_table_name = self.__table_name
         else:
             using_table_name = table_name
 
+        self.__db_c.execute(f"""
+            CREATE TABLE IF NOT EXISTS {self.__runs_table_name}(
+            RUN_ID INTEGER PRIMARY KEY AUTOINCREMENT,
+            CONFIG TEXT,
+            SEED INTEGER,
+            START_TIME DATETIME,
+            END_TIME DATETIME,
+            DAYS_SURVIVED INTEGER
+            );""")
+        self.__db_c.execute(f"""
+            CREATE INDEX IF NOT EXISTS {self.__runs_table_name}_days
+            ON {self.__runs_table_name}(DAYS_SURVIVED);""")
+
         sql_query = f"""
             CREATE TABLE IF NOT EXISTS {using_table_name}(
-            SIM_ID INTEGER PRIMARY KEY AUTOINCREMENT,
+            RUN_ID INTEGER NOT NULL REFERENCES {self.__runs_table_name}(RUN_ID),
+            DAY INTEGER NOT NULL,
             DATE DATETIME,
             """
 
-        for i, column in enumerate(self.__table_columns):
-            if i == len(self.__table_columns) - 1:  # If it's the last column
-                sql_query += f"{column} INTEGER DEFAULT 0\n);"
-            else:
-                sql_query += f"{column} INTEGER DEFAULT 0,\n"
+        for column in self.__table_columns:
+            sql_query += f"{column} INTEGER DEFAULT 0,\n"
+        sql_query += "PRIMARY KEY (RUN_ID, DAY)\n) WITHOUT ROWID;"
 
         self.__db_c.execute(sql_query)
+        self.__db_c.execute(f"""
+            CREATE TABLE IF NOT EXISTS {self.__aggregates_table_name}(
+            RUN_ID INTEGER NOT NULL REFERENCES {self.__runs_table_name}(RUN_ID),
+            COLUMN_NAME TEXT NOT NULL,
+            DAYS INTEGER,
+            MIN INTEGER,
+            MAX INTEGER,
+            TOTAL INTEGER,
+            PEAK_DAY INTEGER,
+            PRIMARY KEY (RUN_ID, COLUMN_NAME)
+            ) WITHOUT ROWID;""")
+        self.__db_c.execute(f"""
+            CREATE TABLE IF NOT EXISTS {self.__instrumentation_table_name}(
+            RUN_ID INTEGER NOT NULL REFERENCES {self.__runs_table_name}(RUN_ID),
+            DAY INTEGER NOT NULL,
+            SNAPSHOT TEXT,
+            PRIMARY KEY (RUN_ID, DAY)
+            ) WITHOUT ROWID;""")
         self.__db.commit()
 
     def drop_table(self, table_name = ''):
-        "Drop the table in the database."
+        "Drop the tables in the database."
+        self.flush()
         if table_name == '':
             using_table_name = self.__table_name
         else:
@@ -92,23 +180,64 @@ class SimsimsAnalytics:
             DROP TABLE IF EXISTS {using_table_name};
             """
         self.__db_c.execute(sql_query)
+        self.__db_c.execute(f"DROP TABLE IF EXISTS {self.__runs_table_name};")
+        self.__db_c.execute(f"DROP TABLE IF EXISTS {self.__aggregates_table_name};")
+        self.__db_c.execute(f"DROP TABLE IF EXISTS {self.__instrumentation_table_name};")
+        self.__db.commit()
+        self.__run_id = None
+        self.__aggregates = None
+        self.__aggregates_cache = {}
+
+    def start_run(self, config: dict = None, seed: int = None) -> int:
+        "Add a run to the runs table, the following steps belongs to this run."
+        self.flush()
+        self.__db_c.execute(
+            f"INSERT INTO {self.__runs_table_name} (CONFIG, SEED, START_TIME) VALUES (?, ?, ?);",
+            (json.dumps(config or {}), seed, dt.datetime.now().strftime('%Y-%m-%d %H:%M:%S')))
+        self.__db.commit()
+        self.__run_id = self.__db_c.lastrowid
+        self.__next_day = 0
+        self.__aggregates = {'days': 0, 'columns': {}}
+        return self.__run_id
+
+    def end_run(self, days_survived: int):
+        "Store the end time, days survived and the aggregates of the current run."
+        if self.__run_id is None:
+            return
+        self.__db_c.execute(
+            f"UPDATE {self.__runs_table_name} SET END_TIME = ?, DAYS_SURVIVED = ? WHERE RUN_ID = ?;",
+            (dt.datetime.now().strftime('%Y-%m-%d %H:%M:%S'), days_survived, self.__run_id))
+        self.__db_c.executemany(
+            f"INSERT OR REPLACE INTO {self.__aggregates_table_name} VALUES (?, ?, ?, ?, ?, ?, ?);",
+            [(self.__run_id, column, self.__aggregates['days'], values['min'], values['max'],
+              values['total'], values['peak_day'])
+             for column, values in self.__aggregates['columns'].items()])
         self.__db.commit()
 
-    def __str__(self, table_name = 'simulations') -> str:
-        if not self.__check_table_exists():
-            return '' # The table does not exist.
+    @property
+    def run_id(self) -> int:
+        return self.__run_id
 
-        if table_name == '':
-            using_table_name = self.__table_name
-        else:
-            using_table_name = table_name
+    def get_runs(self) -> list[tuple]:
+        "Get every run, (RUN_ID, CONFIG, SEED, START_TIME, END_TIME, DAYS_SURVIVED)."
+        self.__db_c.execute(f"SELECT * FROM {self.__runs_table_name} ORDER BY RUN_ID;")
+        return self.__db_c.fetchall()
 
+    def __str__(self) -> str:
+        latest = self.latest_step()
+        return '' if latest is None else str(latest)
+
+    def latest_step(self, run_id: int = None) -> tuple:
+        "The last row of the run (the current run by default), one primary key lookup."
+        self.flush()
+        if not self.__check_table_exists():
+            return None # The table does not exist.
         sql_query = f"""
-                SELECT * FROM {using_table_name};
+                SELECT DAY, DATE, {', '.join(self.__table_columns)} FROM {self.__table_name}
+                WHERE RUN_ID = ? ORDER BY DAY DESC LIMIT 1;
                 """
-        self.__db_c.execute(sql_query)
-        string = self.__db_c.fetchall()[-1]  # Get the last row.
-        return str(string)
+        self.__db_c.execute(sql_query, (run_id or self.__run_id,))
+        return self.__db_c.fetchone()
 
     def __check_table_exists(self):
         # Check if the table exists by querying the system table 'sqlite_master'
@@ -120,30 +249,158 @@ class SimsimsAnalytics:
         # Returns None if table doesn't exist, True if it does.
         return False if self.__db_c.fetchone() is None else True
 
-    def get_rows(self) -> list[tuple]:
-        "Get all the rows of data from the table"
+    def get_rows(self, run_id: int = None) -> list[tuple]:
+        "Get all the rows of data of the run (the current run by default), (DAY, DATE, columns)."
+        self.flush()
         if not self.__check_table_exists():
             print("No table exists")
             return [] # No table exist.
         sql_query = f"""
-                SELECT * FROM {self.__table_name};
+                SELECT DAY, DATE, {', '.join(self.__table_columns)} FROM {self.__table_name}
+                WHERE RUN_ID = ? ORDER BY DAY;
                 """
-        self.__db_c.execute(sql_query)
+        self.__db_c.execute(sql_query, (run_id or self.__run_id,))
         string = self.__db_c.fetchall()
         return list(string)
 
+    def get_page(self, after_day = -1, page_size = 1000, run_id: int = None) -> list[tuple]:
+        """
+        Get page_size rows of the run after the day after_day, the last day of a page
+        is the cursor (after_day) for the next page. Seeks in the primary key, no OFFSET.
+        """
+        self.flush()
+        sql_query = f"""
+                SELECT DAY, DATE, {', '.join(self.__table_columns)} FROM {self.__table_name}
+                WHERE RUN_ID = ? AND DAY > ? ORDER BY DAY LIMIT ?;
+                """
+        # Own cursor, so a page can be read while another query is used.
+        return self.__db.execute(sql_query, (run_id or self.__run_id, after_day,
+                                             page_size)).fetchall()
+
+    def iter_rows(self, run_id: int = None, page_size = 1000):
+        "Iterate over the rows of the run, page_size rows in memory at a time."
+        after_day = -1
+        while True:
+            page = self.get_page(after_day, page_size, run_id)
+            yield from page
+            if len(page) < page_size:
+                return
+            after_day = page[-1][0]
+
+    def __add_to_aggregates(self, day: int, data: tuple):
+        self.__aggregates['days'] += 1
+        for column, value in zip(self.__table_columns, data):
+            values = self.__aggregates['columns'].setdefault(
+                column, {'min': value, 'max': value, 'total': 0, 'peak_day': day})
+            values['min'] = min(values['min'], value)
+            if value > values['max']:
+                values['max'] = value
+                values['peak_day'] = day
+            values['total'] += value
+
+    def aggregates(self, run_id: int = None) -> dict:
+        """
+        Aggregates of the run (the current run by default): {'days': int,
+        'columns': {column: {'min', 'max', 'mean', 'peak_day'}}, 'peak_population_day': int}.
+        Kept up to date as steps are added, stored at the end of a run,
+        and computed (once) from the steps for a run without stored aggregates.
+        """
+        if run_id is None or run_id == self.__run_id:
+            aggregates = self.__aggregates or {'days': 0, 'columns': {}}
+        elif run_id in self.__aggregates_cache:
+            aggregates = self.__aggregates_cache[run_id]
+        else:
+            aggregates = self.__load_aggregates(run_id)
+            self.__aggregates_cache[run_id] = aggregates
+
+        columns = {column: {'min': values['min'], 'max': values['max'],
+                            'mean': values['total'] / aggregates['days'],
+                            'peak_day': values['peak_day']}
+                   for column, values in aggregates['columns'].items()}
+        population = columns.get(self.__table_columns[0])
+        return {'days': aggregates['days'], 'columns': columns,
+                'peak_population_day': population['peak_day'] if population else None}
+
+    def __load_aggregates(self, run_id: int) -> dict:
+        self.flush()
+        self.__db_c.execute(f"""
+            SELECT COLUMN_NAME, DAYS, MIN, MAX, TOTAL, PEAK_DAY FROM {self.__aggregates_table_name}
+            WHERE RUN_ID = ?;""", (run_id,))
+        stored = self.__db_c.fetchall()
+        if stored:
+            return {'days': stored[0][1],
+                    'columns': {column: {'min': low, 'max': high, 'total': total,
+                                         'peak_day': peak_day}
+                                for column, _, low, high, total, peak_day in stored}}
+
+        # Not stored (the run did not end), compute from the steps of the run.
+        aggregates = {'days': 0, 'columns': {}}
+        for column in self.__table_columns:
+            self.__db_c.execute(f"""
+                SELECT COUNT(*), MIN({column}), MAX({column}), SUM({column})
+                FROM {self.__table_name} WHERE RUN_ID = ?;""", (run_id,))
+            days, low, high, total = self.__db_c.fetchone()
+            if not days:
+                break
+            self.__db_c.execute(f"""
+                SELECT DAY FROM {self.__table_name} WHERE RUN_ID = ?
+                ORDER BY {column} DESC, DAY LIMIT 1;""", (run_id,))
+            aggregates['days'] = days
+            aggregates['columns'][column] = {'min': low, 'max': high, 'total': total,
+                                             'peak_day': self.__db_c.fetchone()[0]}
+        return aggregates
+
     # data will be (workers:int, products:int, food:int)
-    # def add_step(self, step:int, data = (0, 0, 0)):
-    def add_step(self, data = (0, 0, 0)):
-        "add step/day to the table, plug in new data"
+    def add_step(self, data = (0, 0, 0), day: int = None):
+        "add step/day to the current run (a new run if none is started), plug in new data"
+        if self.__run_id is None:
+            self.start_run()
+        if day is None:
+            day = self.__next_day
+        self.__next_day = day + 1
+
         insert = f"""
-            INSERT INTO {self.__table_name} (DATE, {', '.join(self.__table_columns)}) 
-            VALUES (?, ?, ?, ?);
+            INSERT INTO {self.__table_name} (RUN_ID, DAY, DATE, {', '.join(self.__table_columns)}) 
+            VALUES (?, ?, ?, {', '.join('?' for _ in self.__table_columns)});
             """
-        self.__db_c.execute(insert, (dt.datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-                                      *data)) #workers, products, food))
+        row = (self.__run_id, day, dt.datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+               *data) #workers, products, food
+        self.__add_to_aggregates(day, data)
+        if self.__writer is not None:
+            self.__writer.add(insert, row)
+            return
+        self.__db_c.execute(insert, row)
+        self.__db.commit()
+
+    def add_snapshot(self, snapshot: dict, day: int):
+        "Add the instrumentation snapshot of a day of the current run, next to its step."
+        insert = f"INSERT OR REPLACE INTO {self.__instrumentation_table_name} VALUES (?, ?, ?);"
+        row = (self.__run_id, day, json.dumps(snapshot))
+        if self.__writer is not None:
+            self.__writer.add(insert, row)
+            return
+        self.__db_c.execute(insert, row)
         self.__db.commit()
 
+    def get_snapshots(self, run_id: int = None) -> list[tuple[int, dict]]:
+        "Get the instrumentation snapshots of a run, (DAY, snapshot)."
+        self.flush()
+        self.__db_c.execute(f"""
+            SELECT DAY, SNAPSHOT FROM {self.__instrumentation_table_name}
+            WHERE RUN_ID = ? ORDER BY DAY;""", (run_id or self.__run_id,))
+        return [(day, json.loads(snapshot)) for day, snapshot in self.__db_c.fetchall()]
+
+    def flush(self):
+        "Wait until every buffered step is written to the database."
+        if self.__writer is not None:
+            self.__writer.flush()
+
+    def stop_writer(self):
+        "Flush and stop the background writer, later steps are written directly."
+        if self.__writer is not None:
+            writer, self.__writer = self.__writer, None
+            writer.stop()
+
     def to_excel(self, filename: str):
         "Create an excel file from the tables data."
         if '.xlsx' not in filename:
@@ -155,41 +412,136 @@ class SimsimsAnalytics:
             path = ''
             print("Specific folder path not found, proceding anyway.")
 
+        self.flush()
         if not self.__check_table_exists():
             print("Table do not exist")
             return
-        sql_quary = f"select date from {self.__table_name};"
-        self.__db_c.execute(sql_quary)
-        date = self.__db_c.fetchall()[0][0] #First value in the first tuple.
+        sql_quary = f"select start_time from {self.__runs_table_name} where run_id = ?;"
+        self.__db_c.execute(sql_quary, (self.__run_id,))
+        date = self.__db_c.fetchone()[0] # Start of the run.
 
         try:
             wb = load_workbook(filename)
         except FileNotFoundError:
             wb = Workbook()
         # Skapar blad med datum och tid som namn på bladet
-        ws = wb.create_sheet(date.replace(":","."))
-        data = self.get_rows()
-
-        for row in data:
-            ws.append(row)
+        self.__append_sheets(wb, date.replace(":","."), self.iter_rows())
         # Sparar till samma filnamn
         if path == '':
             wb.save(filename)
         else:
             wb.save(path + "\\" + filename)
 
+    EXCEL_MAX_ROWS = 1_048_576
+
+    def __append_sheets(self, wb: Workbook, sheet_name: str, rows, header = None):
+        """
+        Append the rows to the workbook, in a new sheet every EXCEL_MAX_ROWS rows.
+        A run without rows still gets its (empty) sheet, a workbook needs one to be saved.
+        """
+        ws, written, sheets = None, self.EXCEL_MAX_ROWS, 0
+        for row in rows:
+            if written == self.EXCEL_MAX_ROWS:
+                sheets += 1
+                ws = wb.create_sheet(sheet_name if sheets == 1 else f"{sheet_name} ({sheets})")
+                written = 0
+                if header:
+                    ws.append(header)
+                    written = 1
+            ws.append(row)
+            written += 1
+        if ws is None:
+            ws = wb.create_sheet(sheet_name)
+            if header:
+                ws.append(header)
+
+    def __export_path(self, filename: str, extension: str) -> str:
+        if not filename.endswith(extension):
+            filename += extension
+        try:
+            return self.__getpath(self.__folder_name) + "\\" + filename
+        except FileNotFoundError:
+            return filename
+
+    def __run_start(self, run_id: int) -> str:
+        self.__db_c.execute(f"select start_time from {self.__runs_table_name} where run_id = ?;",
+                            (run_id,))
+        return self.__db_c.fetchone()[0]
 
-    def to_figure(self, filename:str):
-        "Plot data in a figure and save the figure"
+    def to_excel_stream(self, filename: str, run_id: int = None, chunk_size = 10_000) -> str:
+        """
+        Export a run (the current run by default) to a new Excel file with a write-only
+        workbook, the rows are read chunk_size at a time and written straight to the file,
+        so memory does not grow with the length of the run. A run longer than Excel's
+        row limit continues in the next sheet. Returns the path of the file.
+        """
+        self.flush()
+        run_id = run_id or self.__run_id
+        path = self.__export_path(filename, '.xlsx')
+        wb = Workbook(write_only=True)
+        self.__append_sheets(wb, self.__run_start(run_id).replace(":", "."),
+                             self.iter_rows(run_id, chunk_size),
+                             header=['DAY', 'DATE', *self.__table_columns])
+        wb.save(path)
+        return path
+
+    def to_csv(self, filename: str, run_id: int = None, chunk_size = 10_000) -> str:
+        "Export a run (the current run by default) to a CSV file, chunk_size rows at a time."
+        self.flush()
+        path = self.__export_path(filename, '.csv')
+        with open(path, 'w', newline='', encoding='utf-8') as file:
+            writer = csv.writer(file)
+            writer.writerow(['DAY', 'DATE', *self.__table_columns])
+            after_day = -1
+            while page := self.get_page(after_day, chunk_size, run_id):
+                writer.writerows(page)
+                after_day = page[-1][0]
+        return path
+
+    def to_parquet(self, filename: str, run_id: int = None, chunk_size = 100_000) -> str:
+        """
+        Export a run (the current run by default) to a Parquet file, one row group
+        of columns per chunk_size rows. Needs pyarrow.
+        """
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError as e:
+            raise ImportError("to_parquet needs pyarrow (pip install pyarrow)") from e
+
+        self.flush()
+        path = self.__export_path(filename, '.parquet')
+        schema = pa.schema([('DAY', pa.int64()), ('DATE', pa.string()),
+                            *[(column, pa.int64()) for column in self.__table_columns]])
+        with pq.ParquetWriter(path, schema) as writer:
+            after_day = -1
+            while page := self.get_page(after_day, chunk_size, run_id):
+                writer.write_table(pa.Table.from_arrays(
+                    [list(column) for column in zip(*page)], schema=schema))
+                after_day = page[-1][0]
+        return path
+
+
+    def to_figure(self, filename:str, show = True, max_points = 2000, run_id: int = None):
+        """
+        Plot data in a figure and save the figure.
+        show=False renders headless on the Agg backend (nothing is shown, nothing blocks).
+        Runs longer than max_points days are downsampled, the min and max of every
+        bucket of days are kept, so peaks and crashes are still in the figure.
+        """
         file_path = ''
         try:
             file_path = self.__getpath(self.__folder_name) + '\\'
         except FileNotFoundError:
             file_path = ''
 
+        if not show:
+            pyplot.switch_backend('Agg')
 
         if self.__check_table_exists():
-            data = self.get_rows()
+            latest = self.latest_step(run_id)
+            days = latest[0] + 1 if latest else 0
+            data = self.iter_rows(run_id)
         else:
             if '.xlsx' not in filename:
                 filename += '.xlsx'
@@ -201,20 +553,21 @@ class SimsimsAnalytics:
             except FileNotFoundError:
                 print("Did not find the file")
                 return
-            data = df
-            print(data.head())
-            print(data.columns)
+            print(df.head())
+            print(df.columns)
+            days = len(df)
+            data = df.itertuples(index=False, name=None)
 
         fig, ax = pyplot.subplots()
 
-        arr_step = [row[0] for row in data ]
+        series = downsample_min_max(data, len(self.__table_columns),
+                                    bucket_size= -(-days // max(1, max_points // 2)))
 
         # for resource in data:
-        for i, label in enumerate(self.__table_columns):
-            resource = [row[i + 2] for row in data]
+        for label, (arr_step, resource) in zip(self.__table_columns, series):
             ax.plot(arr_step, resource, label = label)
 
-        ax.set_xticks(arr_step)
+        ax.xaxis.set_major_locator(MaxNLocator(nbins=10, integer=True))
 
         # Add some text for labels, title and custom x-axis tick labels, etc.
         ax.set_title('Resources in the simulation, by day')
@@ -225,12 +578,147 @@ class SimsimsAnalytics:
         fig.tight_layout()
 
         # Show the figure
-        pyplot.show()
+        if show:
+            pyplot.show()
         # Export to file
         fig_filename = filename.rstrip('.xlsx') + '.png'
         fig.savefig(file_path + fig_filename)
         pyplot.close(fig)
 
+    def to_figure_background(self, filename:str, max_points = 2000, run_id: int = None):
+        """
+        Render the figure of a run (the current run by default) headless in a detached
+        process, so this process does not wait for it and can exit right away.
+        """
+        self.flush()
+        arguments = (self.__db_file, self.__table_columns, filename, max_points,
+                     run_id or self.__run_id)
+        code = (f"import sys; sys.path.insert(0, {os.path.dirname(os.path.abspath(__file__))!r}); "
+                f"from simsims_analytics import render_figure; render_figure(*{arguments!r})")
+        subprocess.Popen([sys.executable, '-c', code], stdout=subprocess.DEVNULL,
+                         stderr=subprocess.DEVNULL, start_new_session=True)
+
+
+def render_figure(db_file: str, table_columns: list[str], filename: str,
+                  max_points = 2000, run_id: int = None):
+    "Render the figure of a run headless, used by to_figure_background."
+    SimsimsAnalytics(db_file, table_columns).to_figure(filename, show=False,
+                                                      max_points=max_points, run_id=run_id)
+
+
+def downsample_min_max(rows, columns: int, bucket_size = 1) -> list[tuple[list, list]]:
+    """
+    Split (DAY, DATE, value, ...) rows into (days, values) series per column.
+    With bucket_size > 1 only the lowest and highest value of each bucket of
+    bucket_size rows is kept (in day order), at most two points per bucket.
+    """
+    series = [([], []) for _ in range(columns)]
+    bucket = []
+
+    def add_bucket():
+        for i, (arr_step, resource) in enumerate(series):
+            low = min(bucket, key=lambda row: row[i + 2])
+            high = max(bucket, key=lambda row: row[i + 2])
+            for row in sorted({low[0]: low, high[0]: high}.values()):
+                arr_step.append(row[0])
+                resource.append(row[i + 2])
+
+    for row in rows:
+        bucket.append(row)
+        if len(bucket) >= bucket_size:
+            add_bucket()
+            bucket = []
+    if bucket:
+        add_bucket()
+    return series
+
+
+class BufferedStepWriter:
+    """
+    Writes the steps of a SimsimsAnalytics in batches, on a background thread
+    with its own connection to the database. The queued rows are written with
+    executemany in one transaction when flush_rows rows are queued, when
+    flush_interval seconds has passed, or when a flush is asked for.
+    A batch that fails to be written (a locked or missing table, a full disk) is
+    dropped, the writer keeps running and the error is raised in the caller of
+    the next flush or stop.
+
+    Methods:
+        add(insert, row): Queues a row for the insert statement.
+        flush(): Blocks until every queued row is committed, raises a write error.
+        stop(): Flushes and stops the writer thread, raises a write error.
+    """
+    __FLUSH = object()
+    __STOP = object()
+
+    def __init__(self, db_path: str, flush_rows = 100, flush_interval = 0.5):
+        self.__db_path = db_path
+        self.__flush_rows = flush_rows
+        self.__flush_interval = flush_interval
+        self.__queue = queue.Queue()
+        self.__error: Exception = None
+        self.__thread = th.Thread(target=self.__run, name='SimsimsAnalyticsWriter', daemon=True)
+        self.__thread.start()
+
+    def add(self, insert: str, row: tuple):
+        self.__queue.put((insert, row))
+
+    def flush(self):
+        self.__queue.put(self.__FLUSH)
+        self.__queue.join()
+        self.__raise_error()
+
+    def stop(self):
+        self.__queue.put(self.__STOP)
+        self.__thread.join()
+        self.__raise_error()
+
+    def __raise_error(self):
+        "Raise the error of the writer thread in the caller, once."
+        error, self.__error = self.__error, None
+        if error is not None:
+            raise error
+
+    def __run(self):
+        db = None
+        batch: list[tuple[str, tuple]] = []
+        deadline = None
+        running = True
+
+        while running:
+            timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+            try:
+                item = self.__queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None  # The flush interval has passed.
+
+            if item is self.__STOP:
+                running = False
+            elif item is not None and item is not self.__FLUSH:
+                batch.append(item)
+                if deadline is None:
+                    deadline = time.monotonic() + self.__flush_interval
+                if len(batch) < self.__flush_rows and time.monotonic() < deadline:
+                    continue
+
+            try:
+                if batch:
+                    if db is None:
+                        db = sqlite3.connect(self.__db_path, timeout=30)
+                    with db:  # One transaction for the batch.
+                        for insert, rows in groupby(batch, key=itemgetter(0)):
+                            db.executemany(insert, [row for _, row in rows])
+            except Exception as error:
+                self.__error = error
+            finally:
+                # The rows, and the flush or stop marker, are done.
+                for _ in range(len(batch) + (item is self.__FLUSH or item is self.__STOP)):
+                    self.__queue.task_done()
+            batch = []
+            deadline = None
+        if db is not None:
+            db.close()
+
 
 #  Test this script.
 if __name__ == "__main__":
@@ -0,0 +1,326 @@
+"Module for running many independent simsims worlds in parallel (Monte Carlo)."
+import argparse
+import asyncio
+import random
+import statistics
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from simsims import World, Barack, CohortBarack, Worker
+from simsims_reporting import NullReporter
+
+
+def run_world(seed: int, settlement = 40, resources = 80,
+              engine = 'threads', max_days = None, db_file = None) -> tuple[int, int, float]:
+    """
+    Run one world until the end of the world (or max_days) without any output,
+    the analytics of the run is stored in its own database file, or as a run
+    in the shared database db_file.
+    The threads engine fires in a single pool thread, so a seed always gives the same run.
+    Returns (seed, days survived, seconds).
+    """
+    db_file = db_file or f'Simsims_run_{seed}.db'
+    start = time.perf_counter()
+
+    if engine == 'vectorized':
+        from simsims_vectorized import VectorizedWorld
+        world = VectorizedWorld(settlement, resources, 0, seed=seed, db_file=db_file,
+                                export_results=False, reporter=NullReporter(),
+                                buffered_analytics=True)
+    else:
+        world = World(settlement, resources, 0, runtime='pool', pool_size=1, seed=seed,
+                      db_file=db_file, export_results=False, reporter=NullReporter(),
+                      buffered_analytics=True)
+
+    end_of_the_world = False
+    days = 0
+    while not end_of_the_world and (max_days is None or days < max_days):
+        end_of_the_world = world.tick()
+        days += 1
+    if not end_of_the_world:
+        world.stop()
+
+    return seed, int(world.Days), time.perf_counter() - start
+
+
+def histogram(values: list[int], bins = 10) -> list[tuple[int, int, int]]:
+    "Histogram of the values as (low, high, count), high is exclusive."
+    low, high = min(values), max(values) + 1
+    width = max(1, -(-(high - low) // bins))
+    counts = [0] * (-(-(high - low) // width))
+    for value in values:
+        counts[(value - low) // width] += 1
+    return [(low + i * width, low + (i + 1) * width, count) for i, count in enumerate(counts)]
+
+
+def summarize(days: list[int], seconds: float) -> dict:
+    "Summary statistics of the days survived, and the throughput of the batch."
+    quantiles = statistics.quantiles(days, n=20, method='inclusive') if len(days) > 1 else days * 19
+    return {
+        'runs': len(days),
+        'mean': statistics.fmean(days),
+        'stdev': statistics.stdev(days) if len(days) > 1 else 0.0,
+        'min': min(days),
+        'max': max(days),
+        'quantiles': {5: quantiles[0], 25: quantiles[4], 50: quantiles[9],
+                      75: quantiles[14], 95: quantiles[18]},
+        'histogram': histogram(days),
+        'seconds': seconds,
+        'runs_per_second': len(days) / seconds if seconds > 0 else 0.0,
+    }
+
+
+def run_batch(runs: int, processes = None, first_seed = 0, **world_settings) -> dict:
+    """
+    Run independent worlds with the seeds first_seed .. first_seed + runs - 1
+    across a pool of processes, and summarize how long the civilisations lasted.
+    world_settings are passed on to run_world (settlement, resources, engine, max_days, db_file).
+    """
+    seeds = range(first_seed, first_seed + runs)
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers= processes) as pool:
+        results = list(pool.map(partial(run_world, **world_settings), seeds))
+    summary = summarize([days for _, days, _ in results], time.perf_counter() - start)
+    summary['results'] = results
+    return summary
+
+
+def run_trace(seed: int, settlement = 40, resources = 80, max_days = None,
+              cohort_barack = False, adaptive_capacity = False,
+              db_file = None) -> list[dict[str, int]]:
+    """
+    Run one world of the threads engine in a single pool thread, like run_world,
+    with a Barack or with a CohortBarack. Returns the resource totals of every day.
+    """
+    db_file = db_file or f"Simsims_check_{seed}{'_cohort' if cohort_barack else ''}.db"
+    world = World(settlement, resources, 0, runtime='pool', pool_size=1, seed=seed,
+                  db_file=db_file, export_results=False, reporter=NullReporter(),
+                  cohort_barack=cohort_barack, adaptive_capacity=adaptive_capacity)
+    trace = []
+    end_of_the_world = False
+    while not end_of_the_world and (max_days is None or len(trace) < max_days):
+        end_of_the_world = world.tick()
+        trace.append(dict(world.resource_totals))
+    if not end_of_the_world:
+        world.stop()
+    return trace
+
+
+def check_cohort_barack(runs: int, processes = None, first_seed = 0, **world_settings) -> list[int]:
+    """
+    Run the seeds first_seed .. first_seed + runs - 1 with a Barack and with a CohortBarack,
+    with a fixed and with an adaptive capacity (the world moves the workers as cohorts).
+    A CohortBarack only changes how the workers are stored, so both worlds of a seed must
+    have the same resource totals every day. Returns the seeds where they differ.
+    """
+    seeds = range(first_seed, first_seed + runs)
+    differing = set()
+    with ProcessPoolExecutor(max_workers= processes) as pool:
+        for adaptive_capacity in (False, True):
+            run = partial(run_trace, adaptive_capacity=adaptive_capacity, **world_settings)
+            baracks = pool.map(run, seeds)
+            cohorts = pool.map(partial(run, cohort_barack=True), seeds)
+            differing.update(seed for seed, barack, cohort in zip(seeds, baracks, cohorts)
+                             if barack != cohort)
+    return sorted(differing)
+
+
+class CheckWorld:
+    "Minimal world for checking places outside of a simulation, it keeps the totals."
+    instrumentation = None
+    adaptive_capacity = True # An overflowing place is only flagged, nothing is moved.
+    barn_policy = None
+
+    def __init__(self) -> None:
+        self.totals: dict[str, int] = {}
+
+    def overflowing_resource(self, places):
+        pass
+
+    def resource_changed(self, place, amount: int):
+        self.totals[place.kind] = self.totals.get(place.kind, 0) + amount
+
+
+def check_aliased_worker(barack_type: type = Barack) -> list[str]:
+    """
+    A worker stored twice (as Dining does) is one worker in a barack of barack_type:
+    the copies share its longevity, also when a copy is stored in another barack, and
+    when it dies the copies left are no longer counted or retrieved.
+    Returns the failed expectations.
+    """
+    world = CheckWorld()
+    barack, other = barack_type(world), barack_type(world)
+    failed = []
+
+    def expect(what: str, value, expected):
+        if value != expected:
+            failed.append(f"{barack_type.__name__}: {what} is {value}, expected {expected}")
+
+    worker = Worker(longevity= 50)
+    barack.store(worker)
+    barack.store(worker)
+    barack.store(Worker(longevity= 30))
+    expect("amount stored", (len(barack), world.totals), (3, {'Barack': 3}))
+
+    first = barack.retrieve()
+    expect("longevity of the first copy", first.longevity, 50)
+    first.longevity_change(10)
+    other.store(first)
+    expect("amount after moving a copy", (len(barack), len(other), world.totals),
+           (2, 1, {'Barack': 3}))
+
+    second = barack.retrieve()
+    expect("longevity of the second copy", second.longevity, 60)
+    second.longevity_change(-100)
+    expect("amount after the worker died", (len(barack), len(other), world.totals),
+           (1, 0, {'Barack': 1}))
+
+    expect("longevity of the next worker", barack.retrieve().longevity, 30)
+    expect("amount at the end", (len(barack), len(other), world.totals),
+           (0, 0, {'Barack': 0}))
+    return failed
+
+
+def trace_moves(barack_type: type, seed = 0, workers = 1000) -> list:
+    """
+    Store workers in a barack of barack_type (every third stored twice, as Dining does),
+    move half of them to a second barack with retrieve_many and store_many, and some to
+    a third one by one, with a new worker in between (the copies of a worker are no
+    longer stored one after another). Then change the longevity of retrieved workers,
+    the copies left share it (some die), and retrieve the rest.
+    Returns the amounts, totals and retrieved longevities along the way.
+    """
+    rng = random.Random(seed)
+    world = CheckWorld()
+    baracks = source, target, single = [barack_type(world) for _ in range(3)]
+    trace = []
+    for number in range(workers):
+        worker = Worker(rng)
+        source.store(worker)
+        if number % 3 == 0:
+            source.store(worker)
+    trace.append(([len(barack) for barack in baracks], dict(world.totals)))
+
+    target.store_many(source.retrieve_many(len(source) // 2))
+    for _ in range(workers // 10):
+        single.store(source.retrieve())
+        single.store(Worker(rng))
+    trace.append(([len(barack) for barack in baracks], dict(world.totals)))
+
+    for barack in baracks:
+        for _ in range(min(workers // 10, len(barack))):
+            worker = barack.retrieve()
+            trace.append(worker.longevity)
+            worker.longevity_change(rng.randint(-60, 20))
+        trace.append(([len(barack) for barack in baracks], dict(world.totals)))
+
+    for barack in baracks:
+        trace.append([worker.longevity for worker in barack.retrieve_many(len(barack))])
+    trace.append(([len(barack) for barack in baracks], dict(world.totals)))
+    return trace
+
+
+def check_cohort_moves(seeds = range(10)) -> list[int]:
+    """
+    The bulk moves of a CohortBarack (Cohorts from retrieve_many, stored by store_many)
+    must give the same workers as moving Worker objects between Baracks.
+    Returns the seeds where they differ.
+    """
+    return [seed for seed in seeds if trace_moves(Barack, seed) != trace_moves(CohortBarack, seed)]
+
+
+async def run_worlds_async(worlds: list[World], max_days = None) -> list[int]:
+    """
+    Run the worlds (with the 'asyncio' runtime) concurrently in the running event loop,
+    until the end of each world or max_days. Returns the days each world survived.
+    """
+    async def run(world: World) -> int:
+        end_of_the_world = False
+        days = 0
+        while not end_of_the_world and (max_days is None or days < max_days):
+            end_of_the_world = await world.tick_async()
+            days += 1
+        if not end_of_the_world:
+            world.stop()
+        return int(world.Days)
+
+    return await asyncio.gather(*(run(world) for world in worlds))
+
+
+def run_batch_in_loop(runs: int, first_seed = 0, settlement = 40, resources = 80,
+                      max_days = None, db_file = 'Simsims_asyncio.db') -> dict:
+    """
+    Run independent worlds as coroutines in one event loop, in this thread, every run
+    in the shared database db_file, and summarize them like run_batch.
+    The results are (seed, days survived).
+    """
+    seeds = range(first_seed, first_seed + runs)
+    start = time.perf_counter()
+    # The asyncio runtime buffers the analytics, each world queues its days to a writer
+    # thread, so the loop never waits on a commit.
+    worlds = [World(settlement, resources, 0, runtime='asyncio', seed=seed, db_file=db_file,
+                    export_results=False, reporter=NullReporter()) for seed in seeds]
+    days = asyncio.run(run_worlds_async(worlds, max_days))
+    summary = summarize(days, time.perf_counter() - start)
+    summary['results'] = list(zip(seeds, days))
+    return summary
+
+
+def print_summary(summary: dict):
+    print(f"Runs: {summary['runs']} in {summary['seconds']:.1f}s "
+          f"({summary['runs_per_second']:.2f} runs/s)")
+    print(f"Days survived, mean: {summary['mean']:.1f} stdev: {summary['stdev']:.1f} "
+          f"min: {summary['min']} max: {summary['max']}")
+    print("Quantiles: " + ", ".join(f"p{q}: {value:.1f}"
+                                    for q, value in summary['quantiles'].items()))
+    most = max(count for _, _, count in summary['histogram'])
+    for low, high, count in summary['histogram']:
+        print(f"{low:>6}-{high - 1:<6} {count:>5} {'#' * round(40 * count / most)}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run many simsims worlds in parallel.")
+    parser.add_argument('--runs', type=int, default=20)
+    parser.add_argument('--processes', type=int, default=None)
+    parser.add_argument('--first-seed', type=int, default=0)
+    parser.add_argument('--settlement', type=int, default=40)
+    parser.add_argument('--resources', type=int, default=80)
+    parser.add_argument('--engine', choices=['threads', 'vectorized'], default='threads')
+    parser.add_argument('--max-days', type=int, default=None)
+    parser.add_argument('--db', default=None,
+                        help="Shared database for every run (default: a database per run).")
+    parser.add_argument('--asyncio', action='store_true',
+                        help="Run every world as coroutines in one event loop (threads engine).")
+    parser.add_argument('--check-cohorts', action='store_true',
+                        help="Check that a CohortBarack gives the same worlds as a Barack.")
+    args = parser.parse_args()
+    if args.check_cohorts and (args.asyncio or args.engine != 'threads'):
+        parser.error("--check-cohorts runs the threads engine in a pool thread, "
+                     "it cannot be combined with --asyncio or --engine vectorized")
+    if args.asyncio and args.engine != 'threads':
+        parser.error("--asyncio runs the threads engine, not --engine " + args.engine)
+    if args.asyncio and args.processes is not None:
+        parser.error("--asyncio runs in a single process, --processes does not apply")
+
+    if args.check_cohorts:
+        aliased = check_aliased_worker(Barack) + check_aliased_worker(CohortBarack)
+        for failure in aliased:
+            print(failure)
+        moves = check_cohort_moves()
+        print(f"Moving cohorts and moving workers differ for {len(moves)} of 10 seeds"
+              + (f": {moves}" if moves else "."))
+        differing = check_cohort_barack(args.runs, args.processes, args.first_seed,
+                                        settlement=args.settlement, resources=args.resources,
+                                        max_days=args.max_days, db_file=args.db)
+        print(f"Barack and CohortBarack differ for {len(differing)} of {args.runs} seeds"
+              + (f": {differing}" if differing else "."))
+        if aliased or moves or differing:
+            raise SystemExit(1)
+    elif args.asyncio:
+        print_summary(run_batch_in_loop(args.runs, args.first_seed, args.settlement,
+                                        args.resources, args.max_days,
+                                        args.db or 'Simsims_asyncio.db'))
+    else:
+        print_summary(run_batch(args.runs, args.processes, args.first_seed,
+                                settlement=args.settlement, resources=args.resources,
+                                engine=args.engine, max_days=args.max_days, db_file=args.db))
@@ -0,0 +1,375 @@
+"Module for benchmarking the simsims simulation, its places and storage."
+import argparse
+import datetime as dt
+import json
+import os
+import platform
+import random
+import subprocess
+import time
+import timeit
+import tracemalloc
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+try:
+    import resource
+except ImportError: # Not on Windows, no peak RSS there.
+    resource = None
+from simsims import (World, Barack, CohortBarack, Barn, BucketBarn, Warehouse,
+                     Worker, Food, Product)
+from simsims_analytics import SimsimsAnalytics
+from simsims_reporting import NullReporter
+
+# (settlement, resources, engines), the threaded engines are too slow for the larger sizes.
+WORLD_SIZES = [
+    (40, 80, ('pool', 'threads', 'vectorized')),
+    (10**3, 10**3, ('pool', 'vectorized')),
+    (10**4, 10**4, ('pool', 'vectorized')),
+    (10**5, 10**5, ('vectorized',)),
+    (10**6, 10**6, ('vectorized',)),
+]
+QUICK_WORLD_SIZES = WORLD_SIZES[:2]
+
+
+class BenchWorld:
+    "Minimal world for using places outside of a running simulation."
+    instrumentation = None
+    adaptive_capacity = False # The overflow is handled while storing, as in a World.
+    barn_policy = None # A BucketBarn serves its food 'fifo'.
+
+    def overflowing_resource(self, places):
+        pass
+
+    def resource_changed(self, place, amount):
+        pass
+
+
+class LegacyResource:
+    "A resource as it was before __slots__, an object with a __dict__."
+    def __init__(self, **state) -> None:
+        for name, value in state.items():
+            setattr(self, name, value)
+
+
+def bench_storage(size: int, operations = 10_000, repeat = 3) -> dict[str, float]:
+    """
+    Compare the old list storage with the deque storage of the places.
+
+    The storage is filled with size items, then operations retrieve and store
+    cycles are timed, the same steady state as a place in the simulation.
+    Returns the best time per cycle in nanoseconds for each storage and order,
+    FIFO (Barack, Barn) and LIFO (Warehouse).
+    """
+    def cycle_list_fifo(storage: list):
+        for _ in range(operations):
+            storage.append(storage.pop(0))
+
+    def cycle_deque_fifo(storage: deque):
+        for _ in range(operations):
+            storage.append(storage.popleft())
+
+    def cycle_lifo(storage):
+        for _ in range(operations):
+            storage.append(storage.pop())
+
+    cases = {
+        'list FIFO': (cycle_list_fifo, list),
+        'deque FIFO': (cycle_deque_fifo, deque),
+        'list LIFO': (cycle_lifo, list),
+        'deque LIFO': (cycle_lifo, deque),
+    }
+
+    result = {}
+    for name, (cycle, storage_type) in cases.items():
+        storage = storage_type(range(size))
+        best = min(timeit.repeat(lambda: cycle(storage), number=1, repeat=repeat))
+        result[name] = best / operations * 1e9
+    return result
+
+
+def print_storage_benchmark(sizes = (10**3, 10**4, 10**5, 10**6)):
+    "Print the storage benchmark as a table, nanoseconds per retrieve and store."
+    print(f"{'items':>10}", end="")
+    header_printed = False
+    for size in sizes:
+        result = bench_storage(size)
+        if not header_printed:
+            for name in result:
+                print(f"{name:>14}", end="")
+            print()
+            header_printed = True
+        print(f"{size:>10}", end="")
+        for ns in result.values():
+            print(f"{ns:>12.0f}ns", end="")
+        print()
+
+
+def measure_memory(create) -> int:
+    "Bytes allocated (and still in use) by create()."
+    tracemalloc.start()
+    kept = create()
+    used, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del kept
+    return used
+
+
+def memory_report(sizes = (10**5, 10**6)) -> dict[str, dict[int, tuple[float, float, float]]]:
+    """
+    Bytes per resource before (objects with a __dict__ in a list), slotted (the
+    slotted workers, food and products in the same list) and in the places
+    (workers and food in a Barack/Barn, counted products in a Warehouse).
+    Before and slotted differ only in the objects, slotted and in the places only
+    in the container.
+    Returns {resource: {size: (bytes before, bytes slotted, bytes in the place)}}.
+    """
+    def stored(place_type, create_resource, size):
+        def create():
+            place = place_type(BenchWorld())
+            for _ in range(size):
+                place.store(create_resource())
+            return place
+        return create
+
+    def listed(create_resource, size):
+        return lambda: [create_resource() for _ in range(size)]
+
+    def legacy(size, **state):
+        return lambda: [LegacyResource(**state) for _ in range(size)]
+
+    report = {}
+    for size in sizes:
+        cases = {
+            'Worker': (lambda: [LegacyResource(longevity=random.randint(10, 100))
+                                for _ in range(size)],
+                       listed(Worker, size),
+                       stored(Barack, Worker, size)),
+            'Food': (legacy(size, quality=random.randint(40, 100)),
+                     listed(Food, size),
+                     stored(Barn, Food, size)),
+            'Product': (legacy(size), listed(Product, size), stored(Warehouse, Product, size)),
+        }
+        for name, creates in cases.items():
+            report.setdefault(name, {})[size] = tuple(measure_memory(create) / size
+                                                      for create in creates)
+    return report
+
+
+def print_memory_report(sizes = (10**5, 10**6)):
+    "Print the memory report as a table, bytes per resource."
+    print(f"{'resource':>10}{'items':>10}{'before':>10}{'slotted':>10}{'place':>10}")
+    for name, by_size in memory_report(sizes).items():
+        for size, (before, slotted, place) in by_size.items():
+            print(f"{name:>10}{size:>10}{before:>9.1f}B{slotted:>9.1f}B{place:>9.1f}B")
+
+
+def peak_rss() -> int:
+    "Peak resident set size of this process in bytes, None where it can not be read."
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if platform.system() == 'Darwin' else peak * 1024 # Linux reports kB.
+
+
+def bench_world(settlement = 40, resources = 80, engine = 'pool', max_days = 50,
+                seed = 0) -> dict:
+    """
+    Tick a world until the end of the world or max_days, without output or analytics
+    export. Engine 'threads' and 'pool' are the World runtimes, 'vectorized' the
+    VectorizedWorld. The peak RSS is of the whole process, run it in a fresh process
+    (bench_world_in_process) to measure a single world.
+    """
+    start = time.perf_counter()
+    db_file = 'Simsims_bench.db' # Every benchmarked world is a run in it.
+    if engine == 'vectorized':
+        from simsims_vectorized import VectorizedWorld
+        world = VectorizedWorld(settlement, resources, 0, seed=seed, db_file=db_file,
+                                export_results=False, reporter=NullReporter(),
+                                buffered_analytics=True)
+    else:
+        world = World(settlement, resources, 0, runtime=engine, pool_size=1, seed=seed,
+                      db_file=db_file, export_results=False, reporter=NullReporter(),
+                      buffered_analytics=True)
+    setup = time.perf_counter() - start
+
+    start = time.perf_counter()
+    end_of_the_world = False
+    days = 0
+    while not end_of_the_world and days < max_days:
+        end_of_the_world = world.tick()
+        days += 1
+    seconds = time.perf_counter() - start
+    if not end_of_the_world:
+        world.stop()
+
+    return {
+        'settlement': settlement,
+        'resources': resources,
+        'engine': engine,
+        'days': days,
+        'setup_seconds': setup,
+        'seconds': seconds,
+        'days_per_second': days / seconds if seconds > 0 else 0.0,
+        'firings': world.firings,
+        'firings_per_second': world.firings / seconds if seconds > 0 else 0.0,
+        'peak_rss': peak_rss(),
+    }
+
+
+def bench_world_in_process(**settings) -> dict:
+    "bench_world in a fresh process, so the peak RSS is of that world alone."
+    with ProcessPoolExecutor(max_workers= 1) as pool:
+        return pool.submit(bench_world, **settings).result()
+
+
+def bench_places(size: int, operations = 10_000, repeat = 3) -> dict[str, dict[str, float]]:
+    """
+    Time store and retrieve on each place type holding size resources, one by one and
+    in bulk (operations resources in one store_many and one retrieve_many).
+    Returns {place: {'store': ns, 'retrieve': ns, 'store_many': ns, 'retrieve_many': ns}},
+    the best time per resource.
+    """
+    def store(place, resources):
+        for item in resources:
+            place.store(item)
+
+    def retrieve(place, amount):
+        for _ in range(amount):
+            place.retrieve()
+
+    cases = {
+        'Barack': (Barack, Worker),
+        'CohortBarack': (CohortBarack, Worker),
+        'Barn': (Barn, Food),
+        'BucketBarn': (BucketBarn, Food),
+        'Warehouse': (Warehouse, Product),
+    }
+    operations_by_name = {
+        ('store', 'retrieve'): (store, retrieve),
+        ('store_many', 'retrieve_many'): (lambda place, resources: place.store_many(resources),
+                                          lambda place, amount: place.retrieve_many(amount)),
+    }
+    result = {}
+    for name, (place_type, resource_type) in cases.items():
+        result[name] = {}
+        for (store_name, retrieve_name), (store_all, retrieve_all) in operations_by_name.items():
+            store_times, retrieve_times = [], []
+            for _ in range(repeat):
+                place = place_type(BenchWorld())
+                for _ in range(size):
+                    place.store(resource_type())
+                # New resources every repeat, a stored worker is not shared by places.
+                resources = [resource_type() for _ in range(operations)]
+                start = time.perf_counter()
+                store_all(place, resources)
+                store_times.append(time.perf_counter() - start)
+                start = time.perf_counter()
+                retrieve_all(place, operations)
+                retrieve_times.append(time.perf_counter() - start)
+            result[name][store_name] = min(store_times) / operations * 1e9
+            result[name][retrieve_name] = min(retrieve_times) / operations * 1e9
+    return result
+
+
+def bench_analytics(days = 10_000) -> dict[str, float]:
+    """
+    Time the analytics write path (a commit per step, and buffered) and the export
+    paths (CSV and streamed Excel) for a run of days steps. Returns seconds per case.
+    """
+    result = {}
+    for name, buffered in (('write', False), ('write_buffered', True)):
+        analytics = SimsimsAnalytics(f'Simsims_bench_{name}.db', buffered= buffered)
+        analytics.drop_table() # Only the run of this benchmark.
+        analytics.create_table()
+        analytics.start_run()
+        start = time.perf_counter()
+        for day in range(days):
+            analytics.add_step((day, day, day))
+        analytics.stop_writer()
+        result[name] = time.perf_counter() - start
+        analytics.end_run(days)
+
+    for name, export in (('export_csv', analytics.to_csv),
+                         ('export_excel_stream', analytics.to_excel_stream)):
+        start = time.perf_counter()
+        os.remove(export('Simsims_bench'))
+        result[name] = time.perf_counter() - start
+    result['days'] = days
+    return result
+
+
+def git_commit() -> str:
+    "The current commit, so results can be compared across commits."
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_suite(world_sizes = WORLD_SIZES, place_sizes = (10**3, 10**5),
+              analytics_days = 10_000, max_days = 50) -> dict:
+    "Run every benchmark, the result is plain data for save_results."
+    worlds = []
+    for settlement, resources, engines in world_sizes:
+        for engine in engines:
+            worlds.append(bench_world_in_process(settlement=settlement, resources=resources,
+                                                 engine=engine, max_days=max_days))
+            print_world_result(worlds[-1])
+    return {
+        'commit': git_commit(),
+        'time': dt.datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'worlds': worlds,
+        'places': {size: bench_places(size) for size in place_sizes},
+        'storage': {size: bench_storage(size) for size in place_sizes},
+        'analytics': bench_analytics(analytics_days),
+    }
+
+
+def save_results(results: dict, filename: str):
+    with open(filename, 'w', encoding='utf-8') as file:
+        json.dump(results, file, indent=2)
+
+
+def print_world_result(result: dict):
+    rss = f"{result['peak_rss'] / 2**20:.0f}MB" if result['peak_rss'] else '-'
+    print(f"{result['engine']:>10} {result['settlement']:>8}/{result['resources']:<8}"
+          f"{result['days']:>5} days {result['days_per_second']:>10.1f} days/s "
+          f"{result['firings_per_second']:>12.0f} firings/s {rss:>8}")
+
+
+def print_comparison(old: dict, new: dict):
+    "Print the days per second of the worlds in both results, new relative to old."
+    print(f"{old['commit']} -> {new['commit']}")
+    old_worlds = {(w['engine'], w['settlement'], w['resources']): w for w in old['worlds']}
+    for world in new['worlds']:
+        key = (world['engine'], world['settlement'], world['resources'])
+        if key in old_worlds and old_worlds[key]['days_per_second']:
+            ratio = world['days_per_second'] / old_worlds[key]['days_per_second']
+            print(f"{key[0]:>10} {key[1]:>8}/{key[2]:<8} {ratio:>6.2f}x days/s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the simsims engines and parts.")
+    parser.add_argument('--output', default=None,
+                        help="JSON file for the results (default: benchmark_<commit>.json).")
+    parser.add_argument('--quick', action='store_true', help="Only the small world sizes.")
+    parser.add_argument('--max-days', type=int, default=50)
+    parser.add_argument('--compare', default=None, help="Earlier results to compare with.")
+    parser.add_argument('--storage', action='store_true',
+                        help="Print the storage and memory reports instead.")
+    args = parser.parse_args()
+
+    if args.storage:
+        print_storage_benchmark()
+        print()
+        print_memory_report()
+    else:
+        results = run_suite(QUICK_WORLD_SIZES if args.quick else WORLD_SIZES,
+                            max_days=args.max_days)
+        save_results(results, args.output or f"benchmark_{results['commit']}.json")
+        if args.compare:
+            with open(args.compare, encoding='utf-8') as file:
+                print_comparison(json.load(file), results)
@@ -0,0 +1,56 @@
+"Module for the discrete-event runtime of simsims, a priority queue of timestamped firings."
+import heapq
+from typing import Any, Callable
+
+
+class EventScheduler:
+    """
+EventScheduler keeps the coming firings in a heap ordered by simulated time,
+and runs them one by one in a single thread. Time is in days, a firing at 3.25
+happens a quarter into day 3. Firings at the same time run in the order they
+were scheduled.
+
+Attributes:
+    now (float): Simulated time of the latest firing (or the end of the last run).
+    __heap (list[tuple[float, int, Any]]): (time, sequence, item) of the coming firings.
+    __sequence (int): Counter breaking ties between firings at the same time.
+
+Methods:
+    schedule(time, item): Adds a firing of the item at the time.
+    run_until(end, fire) -> int: Fires every firing before end, in time order.
+    pending() -> list[tuple[float, Any]]: The coming firings, in time order.
+    __len__ () -> int: Amount of coming firings.
+"""
+    def __init__(self) -> None:
+        self.now = 0.0
+        self.__heap: list[tuple[float, int, Any]] = []
+        self.__sequence = 0
+
+    def schedule(self, time: float, item: Any):
+        heapq.heappush(self.__heap, (time, self.__sequence, item))
+        self.__sequence += 1
+
+    def run_until(self, end: float, fire: Callable[[Any, float], float]) -> int:
+        """
+        Pop and fire every firing before end. fire(item, time) returns the time of the
+        item's next firing, or None to drop it. Returns the amount of firings.
+        """
+        heap = self.__heap
+        fired = 0
+        while heap and heap[0][0] < end:
+            time, _, item = heapq.heappop(heap)
+            self.now = time
+            next_time = fire(item, time)
+            if next_time is not None:
+                heapq.heappush(heap, (next_time, self.__sequence, item))
+                self.__sequence += 1
+            fired += 1
+        self.now = end
+        return fired
+
+    def pending(self) -> list[tuple[float, Any]]:
+        "The coming firings as (time, item), in time order."
+        return [(time, item) for time, _, item in sorted(self.__heap)]
+
+    def __len__(self):
+        return len(self.__heap)
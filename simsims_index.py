@@ -0,0 +1,124 @@
+"Module for the load-aware index of the simsims places, used to wire the transitions."
+import heapq
+import threading as th
+from typing import Any
+
+
+class PlaceIndex:
+    """
+PlaceIndex keeps the places of each place type in two heaps, one by the amount of
+resources in the place (the most stocked first, for the inputs of a transition) and
+one by the free room (the least loaded first, for the outputs). Picking a place is
+O(log P) instead of shuffling the whole list of places.
+
+Places with the same load are picked in the order they were added, so a world resumed
+from a checkpoint (its places added in the same order) picks the same places.
+
+The heaps are lazy: a place that changed is only marked dirty, and pushed again with
+its current load the next time a place of its type is picked. An entry is valid as
+long as it is the latest one pushed for its place, the older ones are dropped when
+they reach the top (or when the heap is rebuilt, once it has grown too large).
+
+Attributes:
+    __stocked (dict[str, list[tuple[int, int, int, Any]]]): Per place type a heap of
+        (-resources, number, sequence, place).
+    __room (dict[str, list[tuple[int, int, int, Any]]]): Per place type a heap of
+        (-free room, number, sequence, place).
+    __numbers (dict[Any, int]): The order each indexed place was added in.
+    __latest (dict[Any, int]): Sequence of the valid entries of each indexed place.
+    __dirty (dict[str, dict]): Per place type the places changed since the last pick,
+        in the order they changed.
+    __keys (dict[Any, str]): The place type of each indexed place.
+    __lock (Lock): Guards the index, the places report changes from their threads.
+
+Methods:
+    add(key, place): Indexes a place of the place type key.
+    remove(place): The place is no longer picked.
+    changed(place): Marks the load of the place as changed.
+    most_stocked(key, exclude) -> Place: The place of the type with the most resources.
+    least_loaded(key, exclude) -> Place: The place of the type with the most free room.
+    __len__ () -> int: Amount of indexed places.
+"""
+    def __init__(self) -> None:
+        self.__stocked: dict[str, list[tuple[int, int, int, Any]]] = {}
+        self.__room: dict[str, list[tuple[int, int, int, Any]]] = {}
+        self.__numbers: dict[Any, int] = {}
+        self.__added = 0
+        self.__latest: dict[Any, int] = {}
+        self.__dirty: dict[str, dict] = {}
+        self.__keys: dict[Any, str] = {}
+        self.__sequence = 0
+        self.__lock = th.Lock()
+
+    def add(self, key: str, place):
+        with self.__lock:
+            self.__keys[place] = key
+            self.__numbers[place] = self.__added
+            self.__added += 1
+            self.__stocked.setdefault(key, [])
+            self.__room.setdefault(key, [])
+            self.__dirty.setdefault(key, {})[place] = None
+
+    def remove(self, place):
+        with self.__lock:
+            key = self.__keys.pop(place, None)
+            if key is not None:
+                self.__latest.pop(place, None)
+                self.__numbers.pop(place, None)
+                self.__dirty[key].pop(place, None)
+
+    def changed(self, place):
+        with self.__lock:
+            key = self.__keys.get(place)
+            if key is not None:
+                self.__dirty[key][place] = None
+
+    def most_stocked(self, key: str, exclude = None):
+        "The place of the type with the most resources, other than exclude (None if none)."
+        with self.__lock:
+            return self.__pick(key, self.__stocked, exclude)
+
+    def least_loaded(self, key: str, exclude = None):
+        "The place of the type with the most free room, other than exclude (None if none)."
+        with self.__lock:
+            return self.__pick(key, self.__room, exclude)
+
+    def __pick(self, key: str, heaps: dict[str, list[tuple[int, int, int, Any]]], exclude):
+        if key not in self.__dirty:
+            return None
+        self.__refresh(key)
+        heap = heaps[key]
+        picked, excluded = None, None
+        while heap:
+            _, _, sequence, place = heap[0]
+            if self.__latest.get(place) != sequence:
+                heapq.heappop(heap) # Stale, the place changed or was removed.
+            elif place is exclude:
+                excluded = heapq.heappop(heap)
+            else:
+                picked = place
+                break
+        if excluded is not None:
+            heapq.heappush(heap, excluded)
+        return picked
+
+    def __refresh(self, key: str):
+        "Push the dirty places of the type with their current load."
+        dirty = self.__dirty[key]
+        stocked, room = self.__stocked[key], self.__room[key]
+        for place in dirty:
+            amount, number = len(place), self.__numbers[place]
+            self.__latest[place] = self.__sequence
+            heapq.heappush(stocked, (-amount, number, self.__sequence, place))
+            heapq.heappush(room, (amount - place.capacity, number, self.__sequence, place))
+            self.__sequence += 1
+        dirty.clear()
+
+        # Drop the stale entries, when they outnumber the valid ones.
+        if len(stocked) > 4 * len(self.__latest) + 16:
+            for heap in (stocked, room):
+                heap[:] = [entry for entry in heap if self.__latest.get(entry[3]) == entry[2]]
+                heapq.heapify(heap)
+
+    def __len__(self):
+        return len(self.__keys)
@@ -0,0 +1,124 @@
+"Module for opt-in instrumentation of the simsims hot paths, firings, tick time and locks."
+import threading as th
+import time
+from contextlib import contextmanager
+
+
+class Instrumentation:
+    """
+Instrumentation collects counters of a running world, grouped by what is measured
+('transitions', 'places', 'place_types', 'world', 'observer') and by name in the group.
+
+Per transition type: firings and seconds in _tick.
+Per place ('Barack#0', 'Barack#1', ..., and the world lock): acquires, seconds
+waiting for the lock and seconds holding it, summed per place type in 'place_types'.
+Per ThreadObserver wait: waits and seconds waiting.
+
+A world without instrumentation never calls into this class, the locks are
+plain RLocks and the tick is not timed, so it costs nothing when disabled.
+
+Attributes:
+    __counters (dict[str, dict[str, dict[str, float]]]): group -> name -> counter -> value,
+        since the last snapshot.
+    __instances (dict[str, int]): Per name the amount of instances named so far.
+    __lock (Lock): Guards the counters, the transitions report from their threads.
+
+Methods:
+    add(group, name, **amounts): Adds to the counters of a name in a group.
+    tick(group, name): Context manager timing one firing.
+    waiting(group, name): Context manager timing one wait.
+    instance(name) -> str: A name for the next instance of name, 'name#0', 'name#1', ...
+    lock(group, name, lock, rollup): Wraps a lock so its wait and hold time is counted,
+        also under the (group, name) of rollup.
+    snapshot(): The counters since the last snapshot, and starts over.
+"""
+    def __init__(self) -> None:
+        self.__counters: dict[str, dict[str, dict[str, float]]] = {}
+        self.__instances: dict[str, int] = {}
+        self.__lock = th.Lock()
+
+    def add(self, group: str, name: str, **amounts: float):
+        with self.__lock:
+            counters = self.__counters.setdefault(group, {}).setdefault(name, {})
+            for counter, amount in amounts.items():
+                counters[counter] = counters.get(counter, 0) + amount
+
+    @contextmanager
+    def tick(self, group: str, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(group, name, firings=1, tick_seconds=time.perf_counter() - start)
+
+    @contextmanager
+    def waiting(self, group: str, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(group, name, waits=1, wait_seconds=time.perf_counter() - start)
+
+    def instance(self, name: str) -> str:
+        with self.__lock:
+            number = self.__instances.get(name, 0)
+            self.__instances[name] = number + 1
+        return f'{name}#{number}'
+
+    def lock(self, group: str, name: str, lock = None,
+             rollup: tuple[str, str] = None) -> 'InstrumentedLock':
+        return InstrumentedLock(self, group, name, lock or th.RLock(), rollup)
+
+    def snapshot(self) -> dict[str, dict[str, dict[str, float]]]:
+        "The counters since the last snapshot (a day in the world), plain data for JSON."
+        with self.__lock:
+            counters, self.__counters = self.__counters, {}
+        return counters
+
+
+class InstrumentedLock:
+    """
+A lock (a reentrant RLock by default) that counts the time spent waiting to acquire
+it and holding it. For a reentrant lock only the outermost acquire and release is
+counted, the hold state is only touched by the thread holding the lock. With a rollup
+(group, name) the counts are added there as well, e.g. per place type.
+"""
+    def __init__(self, instrumentation: Instrumentation, group: str, name: str, lock,
+                 rollup: tuple[str, str] = None) -> None:
+        self.__instrumentation = instrumentation
+        self.__group = group
+        self.__name = name
+        self.__lock = lock
+        self.__rollup = rollup
+        self.__depth = 0
+        self.__acquired_at = 0.0
+        self.__wait = 0.0
+
+    def acquire(self, blocking = True, timeout = -1) -> bool:
+        start = time.perf_counter()
+        acquired = self.__lock.acquire(blocking, timeout)
+        if acquired:
+            self.__depth += 1
+            if self.__depth == 1:
+                self.__acquired_at = time.perf_counter()
+                self.__wait = self.__acquired_at - start
+        return acquired
+
+    def release(self):
+        self.__depth -= 1
+        if self.__depth == 0:
+            hold, wait = time.perf_counter() - self.__acquired_at, self.__wait
+            self.__lock.release()
+            self.__instrumentation.add(self.__group, self.__name, acquires=1,
+                                       wait_seconds=wait, hold_seconds=hold)
+            if self.__rollup is not None:
+                self.__instrumentation.add(*self.__rollup, acquires=1,
+                                           wait_seconds=wait, hold_seconds=hold)
+        else:
+            self.__lock.release()
+
+    def __enter__(self) -> bool:
+        return self.acquire()
+
+    def __exit__(self, *exc_info):
+        self.release()
@@ -0,0 +1,122 @@
+"Module for reporting the daily result of a simsims simulation."
+import json
+import time
+from abc import ABC, abstractmethod
+
+
+class Reporter(ABC):
+    """
+Reporter class serving as an abstract base class for the daily reports of a world.
+
+The world hands over a report of every day, the reporter renders it only when it is
+due, every every_days days or when every_seconds seconds has passed since the last
+rendered day (0 turns that limit off). The last day of a run is always rendered.
+
+A day report is a dict with:
+    day (int): The day.
+    resources (dict[str, int]): Amount of resources per place type.
+    labels (dict[str, str]): Text for the resources of each place type.
+    places (dict[str, int]): Amount of places per place type.
+    transitions (dict[str, int]): Amount of transitions per transition type.
+    instrumentation (dict): Only with an instrumented world, the counters of the day
+        (see simsims_instrumentation.Instrumentation.snapshot).
+
+Attributes:
+    every_days (int): Render every every_days day (0 for never by days).
+    every_seconds (float): Render when this many seconds passed since the last render.
+    __last_render (float): Time of the last rendered day.
+
+Methods:
+    report_day(report, last_day): Renders the day report if it is due.
+    report_end(days): Renders how long the civilisation lasted.
+    close(): Releases the reporter's resources, when the world stops (may be called again).
+    _render(report): Abstract method to render one day report.
+    _render_end(days): Abstract method to render the end of the run.
+"""
+    def __init__(self, every_days = 1, every_seconds = 0.0) -> None:
+        self.every_days = every_days
+        self.every_seconds = every_seconds
+        self.__last_render = time.monotonic()
+
+    def report_day(self, report: dict, last_day = False):
+        due = last_day or (self.every_days and report['day'] % self.every_days == 0)
+        if not due and self.every_seconds:
+            due = time.monotonic() - self.__last_render >= self.every_seconds
+        if due:
+            self._render(report)
+            self.__last_render = time.monotonic()
+
+    def report_end(self, days: int):
+        self._render_end(days)
+
+    def close(self):
+        pass
+
+    @abstractmethod
+    def _render(self, report: dict): ...
+
+    @abstractmethod
+    def _render_end(self, days: int): ...
+
+
+class ConsoleReporter(Reporter):
+    """
+ConsoleReporter prints the day reports in the terminal, optionally slowed down with
+sleep_time (a fifth of it after every place type), so the days can be followed.
+"""
+    def __init__(self, every_days = 1, every_seconds = 0.0, sleep_time = 0.0) -> None:
+        super().__init__(every_days, every_seconds)
+        self.sleep_time = sleep_time
+
+    def _render(self, report: dict):
+        print(f"Result of the day: {report['day']}", end= "")
+        for place, resource_of_place in report['resources'].items():
+            print(f"\n{report['labels'][place]} {resource_of_place}", end="")
+            if self.sleep_time:
+                time.sleep(self.sleep_time * 0.2)
+
+        print()
+        for place, amount in report['places'].items():
+            print(f"{place}: {amount}", end=" ")
+        print()
+        for transition, amount in report['transitions'].items():
+            print(f"{transition}: {amount}", end=" ")
+        print("\n")
+
+    def _render_end(self, days: int):
+        print(f"The civilisation lasted: {days} days.")
+
+
+class NullReporter(Reporter):
+    "NullReporter renders nothing, for headless runs."
+    def __init__(self) -> None:
+        super().__init__(every_days= 0)
+
+    def report_day(self, report: dict, last_day = False):
+        pass
+
+    def _render(self, report: dict):
+        pass
+
+    def _render_end(self, days: int):
+        pass
+
+
+class JsonLinesReporter(Reporter):
+    """
+JsonLinesReporter writes the day reports to a file, one JSON object per line,
+and a last line with the days the civilisation lasted.
+"""
+    def __init__(self, filename: str, every_days = 1, every_seconds = 0.0) -> None:
+        super().__init__(every_days, every_seconds)
+        self.__file = open(filename, 'w', encoding='utf-8')
+
+    def _render(self, report: dict):
+        self.__file.write(json.dumps(report) + '\n')
+
+    def _render_end(self, days: int):
+        self.__file.write(json.dumps({'lasted_days': days}) + '\n')
+        self.__file.flush()
+
+    def close(self):
+        self.__file.close()
@@ -0,0 +1,361 @@
+"Module for a vectorized (NumPy) engine of the simsims simulation world."
+import time
+from datetime import date
+from types import MappingProxyType
+import numpy as np
+from simsims_analytics import SimsimsAnalytics
+from simsims_reporting import Reporter, ConsoleReporter
+
+
+class ArrayQueue:
+    """
+ArrayQueue class representing a FIFO (First In, First Out) queue of small integers,
+backed by a NumPy buffer instead of a list of objects.
+
+Values are pushed and popped in batches, the live values are the slice
+[head:tail) of the buffer. When a push does not fit, the live values are
+moved to the front of the buffer, which doubles in size if that is not enough.
+
+Attributes:
+    __buffer (ndarray): Backing buffer holding the values.
+    __head (int): Index of the first (oldest) value.
+    __tail (int): Index after the last (newest) value.
+
+Methods:
+    push(values): Appends a batch of values at the back of the queue.
+    popleft(amount) -> ndarray: Removes and returns up to amount values from the front.
+    __len__ () -> int: Returns the number of values in the queue.
+"""
+    def __init__(self, dtype = np.int16, size = 1024) -> None:
+        self.__buffer = np.empty(max(size, 1), dtype=dtype)
+        self.__head = 0
+        self.__tail = 0
+
+    def push(self, values: np.ndarray):
+        amount = len(values)
+        if self.__tail + amount > len(self.__buffer):
+            live = self.__tail - self.__head
+            # Double the buffer only if compacting is not enough.
+            size = len(self.__buffer)
+            while live + amount > size:
+                size *= 2
+            buffer = np.empty(size, dtype=self.__buffer.dtype)
+            buffer[:live] = self.__buffer[self.__head:self.__tail]
+            self.__buffer = buffer
+            self.__head = 0
+            self.__tail = live
+        self.__buffer[self.__tail:self.__tail + amount] = values
+        self.__tail += amount
+
+    def popleft(self, amount: int) -> np.ndarray:
+        amount = min(amount, len(self))
+        values = self.__buffer[self.__head:self.__head + amount].copy()
+        self.__head += amount
+        return values
+
+    def __len__(self):
+        return self.__tail - self.__head
+
+
+class VectorizedWorld:
+    """
+    Represents the same simulated world as simsims.World, but with the
+    resources kept in NumPy arrays instead of Python objects.
+    Worker longevities and food qualities are FIFO queues of integers, products
+    are a counter (they carry no state). Instead of one thread per transition,
+    all firings of a transition type are applied as one batched array operation
+    per day, which makes settlements of millions of workers feasible.
+    The priorities, the iteration limits and the adaptive growth of transitions
+    follows the reference engine (simsims.World), so the daily results and the
+    analytics are comparable between the engines.
+
+    Attributes:
+        sleep_time (float): If the user want to slow down the day iteration.
+        __end_of_the_world (bool): Has the world come to an end, end the simulation.
+        __analytics (SimSimsAnalytics): Track the daily data from the simulation,
+            written in batches in the background with buffered_analytics.
+        __day: Track the day, the simulation is on.
+        __rng (Generator): NumPy random generator for every random draw of the world.
+        __export_results (bool): Export the analytics to Excel and a figure at the end.
+        __figure (str): How the end figure is rendered, 'background' (headless in a
+            detached process, the world does not wait for it), 'headless' or 'show'.
+        __reporter (Reporter): Renders the daily results, a ConsoleReporter by default.
+        __workers (ArrayQueue): Longevity of each worker, in barack order (FIFO).
+        __food (ArrayQueue): Quality of each food, in barn order (FIFO).
+        __products (int): Amount of products in the warehouses.
+        __transitions (dict[str, dict[str, ndarray]]): Parameters per transition type,
+            one array entry per transition.
+
+    Methods:
+        tick(): The uppdate method, fires every transition type once in batch.
+        decrease_prio(producer, times): Decreases priority since we created this resource.
+        firings (int): Amount of transition firings since the start.
+        resource_totals (Mapping[str, int]): Read-only snapshot of the resources per place type.
+        stop(): Stops the run, writes every buffered day and closes the reporter.
+        export_to_excel(): Exports simulation data to an Excel file for analysis.
+    """
+    def __init__(
+            self,
+            starting_settlement = 40,
+            strating_resources = 80,
+            sleep_time = 1,
+            seed = None,
+            db_file = 'Simsims_db.db',
+            export_results = True,
+            reporter: Reporter = None,
+            buffered_analytics = False,
+            figure = 'background'
+            ) -> None:
+        if figure not in ('background', 'headless', 'show'):
+            raise ValueError(f"Unknown figure mode: {figure}")
+        self.__day = 0
+        self.sleep_time = sleep_time
+        self.__export_results = export_results
+        self.__figure = figure
+        self.__reporter = reporter or ConsoleReporter(sleep_time= sleep_time)
+        self.__end_of_the_world = False
+        if seed is None:
+            seed = int(np.random.SeedSequence().entropy % 2**32) # Stored with the run.
+        self.__rng = np.random.default_rng(seed)
+        self.__capacity = 20    # Same capacity as simsims.Place.
+        self.__max_amount = 50  # Same limit as simsims.Transition.
+        self.__firings = 0
+
+        self.__priority: dict[str, int] = {}
+        self.__transitions: dict[str, dict[str, np.ndarray]] = {}
+
+        self.__workers = ArrayQueue(size = starting_settlement)
+        self.__workers.push(self.__new_workers(starting_settlement))
+
+        is_food = self.__rng.integers(0, 2, strating_resources) == 0
+        self.__food = ArrayQueue(size = strating_resources)
+        self.__food.push(self.__rng.integers(40, 101, int(is_food.sum()), dtype=np.int16))
+        self.__products = int(strating_resources - is_food.sum())
+
+        # Create a small initial settlement, same as the reference world.
+        for _ in range(0, 4):
+            self.__create_transition('Factory')
+            self.__create_transition('Fields')
+            self.__create_transition('Dining')
+            self.__create_transition('Home')
+            self.__create_transition('Home')
+
+        table_columns = ['Worker', 'Product', 'Food']
+
+        self.__analytics = SimsimsAnalytics(db_file, table_columns,
+                                            buffered= buffered_analytics)
+        self.__analytics.create_table()
+        self.__analytics.start_run(config= {
+            'engine': 'vectorized',
+            'starting_settlement': starting_settlement,
+            'strating_resources': strating_resources,
+            }, seed= seed)
+
+    def __new_workers(self, amount: int) -> np.ndarray:
+        return self.__rng.integers(10, 101, amount, dtype=np.int16)
+
+    def __create_transition(self, key: str, amount = 1):
+        rng = self.__rng
+        if key == 'Factory':
+            params = {'longevity_cost': rng.integers(5, 16, amount),
+                      'accident_prob': rng.integers(3, 7, amount)}
+        elif key == 'Fields':
+            params = {'accident_prob': rng.integers(3, 7, amount)}
+        else:
+            params = {'amount': np.zeros(amount, dtype=np.int8)}
+
+        if key not in self.__transitions:
+            self.__transitions[key] = params
+        else:
+            for name, values in params.items():
+                self.__transitions[key][name] = np.concatenate(
+                    (self.__transitions[key][name], values))
+
+        if key not in self.__priority:
+            self.__priority[key] = 0
+
+    def __transition_amount(self, key: str) -> int:
+        return len(next(iter(self.__transitions[key].values())))
+
+    def decrease_prio(self, producer: str, times = 1):
+        if times <= 0:
+            return
+        if producer not in self.__priority:
+            self.__priority[producer] = 0
+        else:
+            self.__priority[producer] = max(0, self.__priority[producer] - times)
+
+    def __raise_priority(self, times: int):
+        "Raise priority, once for every firing that lacked resources."
+        # In the reference engine every producer matches the lacking place
+        # (producer_of and handle_resource are both the type name), so every
+        # priority is raised and every transition type may grow.
+        if times <= 0:
+            return
+        for key in self.__priority:
+            before = self.__priority[key]
+            self.__priority[key] += times
+            # Amount of single raises that ended above the limit of 5.
+            over_limit = max(0, times - max(0, 5 - before))
+            new_amount = min(over_limit,
+                             self.__max_amount - self.__transition_amount(key))
+            if new_amount > 0:
+                self.__create_transition(key, new_amount)
+
+    @property
+    def Days(self):
+        return str(self.__day)
+
+    @property
+    def firings(self) -> int:
+        return self.__firings
+
+    @property
+    def resource_totals(self) -> MappingProxyType:
+        "Read-only snapshot of the amount of resources per place type."
+        return MappingProxyType({'Barack': len(self.__workers),
+                                 'Warehouse': self.__products,
+                                 'Barn': len(self.__food)})
+
+    @property
+    def check_endOfTheWorld(self) -> bool:
+        if len(self.__workers) == 0:
+            self.__end_of_the_world = True
+        return self.__end_of_the_world
+
+    def __fire_factory(self, firings: int):
+        params = self.__transitions['Factory']
+        longevity = self.__workers.popleft(firings).astype(np.int32)
+        amount = len(longevity)
+
+        accident = self.__rng.integers(1, 11, amount) > params['accident_prob'][:amount]
+        longevity = np.where(accident, 0, longevity - params['longevity_cost'][:amount])
+        survivors = longevity[longevity > 0]
+
+        self.__products += len(survivors)
+        self.__workers.push(survivors)
+        self.decrease_prio('Factory', len(survivors))
+        self.__raise_priority(firings - amount)
+
+    def __fire_fields(self, firings: int):
+        params = self.__transitions['Fields']
+        longevity = self.__workers.popleft(firings).astype(np.int32)
+        amount = len(longevity)
+
+        accident = self.__rng.integers(1, 11, amount) < params['accident_prob'][:amount]
+        damage = self.__rng.integers(10, 71, amount)
+        longevity = np.where(accident, longevity - damage, longevity)
+        survivors = longevity[longevity > 0]
+
+        self.__food.push(self.__rng.integers(20, 101, len(survivors)))
+        self.__workers.push(survivors)
+        self.decrease_prio('Fields', len(survivors))
+        self.__raise_priority(firings - amount)
+
+    def __fire_dining(self, firings: int):
+        amount = min(firings, len(self.__workers), len(self.__food))
+        longevity = self.__workers.popleft(amount).astype(np.int32)
+        quality = self.__food.popleft(amount).astype(np.int32)
+
+        # Food is rotten/food poison if below 30 in quality.
+        longevity = np.clip(longevity + np.round(quality - 30 * 0.2).astype(np.int32), 0, 100)
+        longevity = longevity[longevity > 0]
+        # The reference Dining sends the same worker object back twice, the alias
+        # shares the longevity of the worker, so it is one worker here.
+        self.__workers.push(longevity)
+        self.decrease_prio('Dining', amount)
+
+        empty_places = int(len(self.__workers) == 0) + int(len(self.__food) == 0)
+        self.__raise_priority((firings - amount) * empty_places)
+
+    def __fire_home(self, firings: int):
+        amount = min(firings, len(self.__workers), self.__products)
+        longevity = self.__workers.popleft(amount).astype(np.int32)
+        self.__products -= amount
+
+        # Either get a healthier worker or 1 new worker, reproduction needs a second worker.
+        hometype = self.__rng.integers(0, 2, amount).astype(bool)
+        partners_left = max(0, len(self.__workers) - 1)
+        reproduce = hometype & (np.cumsum(hometype) <= partners_left)
+        couples = int(reproduce.sum())
+
+        partners = self.__workers.popleft(couples).astype(np.int32)
+        children = self.__new_workers(couples).astype(np.int32)
+        rested = np.minimum(longevity[~reproduce] + 5, 100)
+        families = np.column_stack((longevity[reproduce], partners, children)).ravel()
+
+        self.__workers.push(rested)
+        self.__workers.push(families)
+        self.decrease_prio('Home', couples)
+
+        empty_places = int(len(self.__workers) == 0) + int(self.__products == 0)
+        self.__raise_priority((firings - amount) * empty_places)
+
+    def tick(self):
+        # Logic to produce what is prioritized.
+        produce_prio = sorted(self.__priority, key=self.__priority.get, reverse=True)
+
+        # Limit iterations based on existing workers.
+        worker_amount = len(self.__workers)
+        fire = {'Factory': self.__fire_factory, 'Fields': self.__fire_fields,
+                'Dining': self.__fire_dining, 'Home': self.__fire_home}
+
+        for producer in produce_prio:
+            iterations = worker_amount // 10 + (len(produce_prio) * 2)
+            firings = min(iterations, self.__transition_amount(producer))
+            fire[producer](firings)
+            self.__firings += firings
+
+        transition_length = sum(self.__transition_amount(key) for key in self.__transitions)
+        if (self.__day + 1) % transition_length == 0 and self.sleep_time:
+            time.sleep(self.sleep_time)
+
+        return self.__result_of_day()
+
+    def __place_amount(self, resource_amount: int) -> int:
+        "Amount of places the reference world would at least need for the resources."
+        return max(1, -(-resource_amount // self.__capacity))
+
+    def __result_of_day(self) -> bool:
+        resources = dict(self.resource_totals)
+        if resources['Barack'] == 0:
+            self.__end_of_the_world = True
+
+        self.__reporter.report_day({
+            'day': self.__day,
+            'resources': resources,
+            'labels': {'Barack': "Workers in barack: ",
+                       'Warehouse': "Products in warehouse: ",
+                       'Barn': "Food in barn: "},
+            'places': {place: self.__place_amount(amount) for place, amount in resources.items()},
+            'transitions': {transition: self.__transition_amount(transition)
+                            for transition in self.__transitions},
+            }, last_day= self.__end_of_the_world)
+
+        # Add the day, to the database.
+        self.__analytics.add_step(data = tuple(resources.values()), day= self.__day)
+
+        if not self.__end_of_the_world:
+            self.__day += 1
+        else: # End of the Civilization.
+            self.__reporter.report_end(self.__day)
+            self.stop()
+            if self.__export_results:
+                self.export_to_excel()
+            if self.__export_results:
+                if self.__figure == 'background':
+                    self.__analytics.to_figure_background("Simsim_graph")
+                else:
+                    self.__analytics.to_figure("Simsim_graph", show= self.__figure == 'show')
+        return self.__end_of_the_world
+
+    def stop(self):
+        "Stop the run, no transition threads here, but every buffered day is written."
+        self.__analytics.stop_writer()
+        self.__analytics.end_run(self.__day)
+        self.__reporter.close()
+
+    def export_to_excel(self):
+        # A file per run, streamed, instead of loading and saving a growing workbook.
+        filename = f'Simsims_{date.today()}_run{self.__analytics.run_id}'
+        self.__analytics.to_excel_stream(filename= filename)